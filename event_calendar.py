@@ -10,6 +10,7 @@ import time
 import pandas as pd
 import os
 import traceback as trb
+from instrumentation import stage
 #from returns_main import input_folder
 
 def FormatDate(DateStr):
@@ -100,9 +101,12 @@ def StartWebscrapper(**kwargs):
             kwargs['TargetTimezoneName']=="UnavailableTimeZone"
 
     MaxAttempts=3
-    for _ in range(MaxAttempts):
+    for attempt in range(MaxAttempts):
         try:
-            return PrepareCalendar(**kwargs)
+            with stage('prepare_calendar',attempt=attempt+1) as record:
+                alldf=PrepareCalendar(**kwargs)
+                record['rows']=len(alldf[0])
+            return alldf
         except Exception as e:
             print('Some error occurred in fetching data. Retrying...')
             print(e)
@@ -142,7 +146,8 @@ def PrepareCalendar(**kwargs):
         mydf.dropna(inplace=True)
         mydf = mydf.replace('®', '', regex=True)#regex replaces even if the sign is inside the text and not just the sign.
         mydf['Tier']=mydf['Tier'].mask(mydf['Tier']=='N/A').ffill() #If tier is N/A, then replace it with not null value that came immediately before that N/A cell.
-        return StoreCalendar(mydf.copy(),**kwargs)
+        with stage('store_calendar',rows=len(mydf)):
+            return StoreCalendar(mydf.copy(),**kwargs)
 
 
 def GetTiers(**kwargs):
@@ -1,6 +1,7 @@
 # For github Actions:
 
 from event_calendar import StartWebscrapper,all_timezones,time,webdriver,os
+from instrumentation import RunReport
 
 def runner(**kwargs):
     # Initialize the driver
@@ -39,6 +40,8 @@ def runner(**kwargs):
     print(filtered_df)
 
 
+# Timings of every stage are appended to logs/run_report.jsonl and summarised at the end
+report = RunReport('event_calendar_runner_main').start()
 #Scatter events by country and timezone
 SelectCountries =  ['US']
 TargetTimezone = {'IST':'UTC +5:30'}
@@ -53,3 +56,4 @@ OutputDirectory='Input_data'
 runner(OutputDirectory=OutputDirectory,
        TargetTimezone=TargetTimezone,
        SelectCountries=SelectCountries)
+report.finish()
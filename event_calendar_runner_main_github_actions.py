@@ -1,4 +1,5 @@
 from event_calendar import StartWebscrapper,all_timezones,time,webdriver,os
+from instrumentation import RunReport
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
@@ -75,6 +76,8 @@ def runner(**kwargs):
     print(filtered_df)
 
 
+# Timings of every stage are appended to logs/run_report.jsonl and summarised at the end
+report = RunReport('event_calendar_runner_main_github_actions').start()
 # Scatter events by country and timezone
 SelectCountries =  ['US']
 TargetTimezone = {'IST':'UTC +5:30'}
@@ -89,3 +92,4 @@ OutputDirectory='Input_data'
 runner(OutputDirectory=OutputDirectory,
        TargetTimezone=TargetTimezone,
        SelectCountries=SelectCountries)
+report.finish()
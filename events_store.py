@@ -0,0 +1,129 @@
+import os
+import json
+import pandas as pd
+from manifest import get_file_hash
+
+# Parquet needs pyarrow. Without it the events are stored as csv, with their dtypes kept in the key file.
+try:
+    import pyarrow
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+
+class EventsStore:
+    """
+    Keeps the processed events of an events workbook in a typed binary file, with the
+    timestamps in the target timezone and int8 tiers and flags, so that the workbook
+    is only parsed again when it changes.
+
+    The file is reused while the hash of the workbook and the tier, flag and timezone
+    parameters are the ones it was built with. They are kept in a json file next to
+    it, with the size of the workbook, so that a changed workbook is usually detected
+    without hashing it. The mtime is not used, as a fresh checkout of the repository
+    gives the workbook a new one. The file format and the pandas version are part of
+    the key too, and a file that cannot be read is rebuilt.
+    """
+    def __init__(self, store_folder, workbook_name):
+        self.store_folder = store_folder
+        stem = os.path.splitext(os.path.basename(workbook_name))[0]
+        extension = "parquet" if PARQUET_AVAILABLE else "csv"
+        self.data_path = os.path.join(store_folder, f"{stem}_events.{extension}")
+        self.key_path = os.path.join(store_folder, f"{stem}_events_key.json")
+
+    def __str__(self):
+        return f'EventsStore at {self.data_path}'
+
+    @staticmethod
+    def get_parameters(**parameters):
+        # Through json, so that the parameters compare equal to the stored ones
+        return json.loads(json.dumps(parameters, sort_keys=True, default=str))
+
+    @staticmethod
+    def get_key(workbook_path, **parameters):
+        """
+        Key of the processed events of a workbook.
+
+        Args:
+            workbook_path (str): Path of the events workbook.
+            **parameters: Tier and flag dictionaries and timezones the events are processed with.
+
+        Returns:
+            dict: size and sha256 of the workbook, the parameters, the file format and the pandas version.
+        """
+        return {
+            "size": os.path.getsize(workbook_path),
+            "sha256": get_file_hash(workbook_path),
+            "parameters": EventsStore.get_parameters(**parameters),
+            "format": "parquet" if PARQUET_AVAILABLE else "csv",
+            "pandas": pd.__version__,
+        }
+
+    @staticmethod
+    def get_typed_events(events_df):
+        """
+        Casts the tier and the IND_ flags of the processed events to int8.
+        """
+        events_df = events_df.copy()
+        for col in events_df.columns:
+            if str(col).startswith("IND_") or str(col).lower() in ["tier", "tiers"]:
+                events_df[col] = events_df[col].astype("int8")
+        return events_df
+
+    def load(self, workbook_path, **parameters):
+        """
+        Reads the stored events if they were built from the same workbook contents and parameters.
+
+        Args:
+            workbook_path (str): Path of the events workbook.
+            **parameters: Tier and flag dictionaries and timezones the events are processed with.
+
+        Returns:
+            pd.DataFrame: Processed events, or None if they are missing or stale.
+        """
+        if not os.path.exists(self.key_path) or not os.path.exists(self.data_path):
+            return None
+        with open(self.key_path) as file:
+            stored_key = json.load(file)
+        # Cheap checks first, the workbook is only hashed when its size did not change
+        if stored_key.get("parameters") != self.get_parameters(**parameters):
+            return None
+        if stored_key.get("format") != ("parquet" if PARQUET_AVAILABLE else "csv"):
+            return None
+        if stored_key.get("pandas") != pd.__version__:
+            return None
+        if stored_key.get("size") != os.path.getsize(workbook_path):
+            return None
+        if stored_key.get("sha256") != get_file_hash(workbook_path):
+            return None
+        try:
+            if PARQUET_AVAILABLE:
+                return pd.read_parquet(self.data_path)
+            return self._read_csv(self.data_path, stored_key["dtypes"])
+        except Exception as error:
+            print(f"Could not read {self.data_path} ({error}), parsing the events again")
+            return None
+
+    @staticmethod
+    def _read_csv(path, dtypes):
+        # Restores the dtypes saved in the key, with the timestamps in their timezone
+        events_df = pd.read_csv(path)
+        for col, dtype in dtypes.items():
+            dtype = pd.api.types.pandas_dtype(dtype)
+            if isinstance(dtype, pd.DatetimeTZDtype):
+                events_df[col] = pd.to_datetime(events_df[col], utc=True).dt.tz_convert(dtype.tz)
+            elif dtype != object:
+                events_df[col] = events_df[col].astype(dtype)
+        return events_df[list(dtypes)]
+
+    def save(self, events_df, workbook_path, **parameters):
+        os.makedirs(self.store_folder, exist_ok=True)
+        if PARQUET_AVAILABLE:
+            events_df.to_parquet(self.data_path, index=False)
+        else:
+            events_df.to_csv(self.data_path, index=False)
+        key = self.get_key(workbook_path, **parameters)
+        key["dtypes"] = {str(col): str(dtype) for col, dtype in events_df.dtypes.items()}
+        # The key is written last, so that an interrupted save is rebuilt next time
+        with open(self.key_path, "w") as file:
+            json.dump(key, file, indent=1)
@@ -0,0 +1,94 @@
+import os
+import pandas as pd
+
+# Parquet and Feather need pyarrow. Without it the processed frames are saved as csv.
+try:
+    import pyarrow
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+FRAME_FORMATS = {"parquet": ".parquet", "feather": ".feather", "csv": ".csv"}
+
+
+def get_frame_format(frame_format="parquet"):
+    """
+    Resolves the requested format of the processed frames to the one that can be written here.
+
+    Args:
+        frame_format (str, optional): "parquet", "feather" or "csv". Default is "parquet".
+
+    Returns:
+        str: The requested format, or "csv" if it needs pyarrow and pyarrow is not installed.
+    """
+    if frame_format not in FRAME_FORMATS:
+        raise ValueError(f"Invalid frame_format. Use one of {list(FRAME_FORMATS)}.")
+    if frame_format != "csv" and not PYARROW_AVAILABLE:
+        print("pyarrow is not installed, saving the processed frames as csv.")
+        return "csv"
+    return frame_format
+
+
+class FrameStore:
+    """
+    Saves and loads the processed frames (tagged and nonevents data) in a columnar
+    format. Parquet and Feather keep the tz-aware timestamps and store the session
+    and event name columns as categoricals, so the files are smaller and are loaded
+    without parsing text. A csv copy can still be exported next to them.
+    """
+    def __init__(self, frame_format="parquet", export_csv=False, categorical_columns=("session", "events")):
+        self.frame_format = get_frame_format(frame_format)
+        self.export_csv = export_csv and self.frame_format != "csv"
+        self.categorical_columns = list(categorical_columns)
+
+    def __str__(self):
+        return f'FrameStore in {self.frame_format} format' + (' with csv export' if self.export_csv else '')
+
+    def get_path(self, path_stem, frame_format=None):
+        return path_stem + FRAME_FORMATS[frame_format or self.frame_format]
+
+    def save(self, df, path_stem):
+        """
+        Saves a processed frame.
+
+        Args:
+            df (pd.DataFrame): Processed frame.
+            path_stem (str): Path of the file without the extension, eg "processed/ZN_1h_events_tagged_target_tz".
+
+        Returns:
+            list: Paths of the written files, the frame first and the csv export if requested.
+        """
+        path = self.get_path(path_stem)
+        if self.frame_format == "csv":
+            df.to_csv(path, index=False)
+            return [path]
+
+        typed_df = df.reset_index(drop=True)
+        for col in self.categorical_columns:
+            if col in typed_df.columns and not isinstance(typed_df[col].dtype, pd.CategoricalDtype):
+                typed_df[col] = typed_df[col].astype("category")
+        if self.frame_format == "parquet":
+            typed_df.to_parquet(path, index=False)
+        else:
+            typed_df.to_feather(path)
+        paths = [path]
+
+        if self.export_csv:
+            csv_path = self.get_path(path_stem, "csv")
+            df.to_csv(csv_path, index=False)
+            paths.append(csv_path)
+        return paths
+
+    @staticmethod
+    def load(path):
+        """
+        Loads a processed frame saved in any of the formats, chosen by the file extension.
+        Timestamps of csv files are left as text.
+        """
+        extension = os.path.splitext(path)[1]
+        if extension == ".parquet":
+            return pd.read_parquet(path)
+        if extension == ".feather":
+            return pd.read_feather(path)
+        # round_trip keeps the floats identical to the ones that were saved
+        return pd.read_csv(path, float_precision="round_trip")
@@ -0,0 +1,179 @@
+import os
+import sys
+import json
+import time
+import atexit
+import functools
+from contextlib import contextmanager
+from datetime import datetime
+import pandas as pd
+
+# Peak memory comes from the resource module, which is not available on Windows
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Run report shared by the scripts, one json line per stage. The logs folder is not
+# committed, so the workflows that commit their outputs do not commit the report.
+RUN_REPORT_FILE = os.path.join("logs", "run_report.jsonl")
+
+
+def get_peak_rss_mb():
+    """
+    Peak resident memory of this process so far (its lifetime high-water mark), in MB.
+    None where it cannot be measured.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    if sys.platform == "darwin":
+        peak = peak / 1024
+    return round(peak / 1024, 1)
+
+
+class RunReport:
+    """
+    Collects the wall time, CPU time, memory growth and row count of the stages of a
+    run and appends them to a json-lines file, so that the runs can be compared.
+    The record of the whole run also has the peak memory of the process.
+
+    Call start() before the run and finish() after it, or use it as a context manager;
+    stages are recorded with stage() or timed() while a report is active. A run that
+    stops before finish(), eg on an exception, is finished with the status "failed"
+    when the process exits. Without an active report the stages are
+    timed but not kept.
+    """
+    # Report of the running script, see RunReport.get_active
+    _active = None
+
+    def __init__(self, script, path=RUN_REPORT_FILE, console=True):
+        self.script = script
+        self.path = path
+        self.console = console
+        self.records = []
+        self.run_id = None
+        self._started = None
+
+    def __str__(self):
+        return f'RunReport of {self.script} with {len(self.records)} stages'
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.finish(status="ok" if exc_type is None else "failed")
+        return False
+
+    @classmethod
+    def get_active(cls):
+        return cls._active
+
+    def start(self):
+        """
+        Makes this report the active one of the process.
+        """
+        self.run_id = datetime.now().isoformat(timespec="seconds")
+        self._started = (time.perf_counter(), time.process_time())
+        RunReport._active = self
+        atexit.register(self.finish, status="failed")
+        return self
+
+    def add(self, record):
+        self.records.append(record)
+
+    def collect_records(self):
+        """
+        Returns and clears the records so far, eg to send the records of a worker
+        process to the report of the parent process.
+        """
+        records, self.records = self.records, []
+        return records
+
+    def finish(self, status="ok"):
+        """
+        Records the whole run, appends the records to the report file and prints the summary.
+        """
+        atexit.unregister(self.finish)
+        wall, cpu = self._started
+        self.add({
+            "stage": "run",
+            "wall_s": round(time.perf_counter() - wall, 4),
+            "cpu_s": round(time.process_time() - cpu, 4),
+            "peak_rss_mb": get_peak_rss_mb(),
+            "rows": None,
+            "status": status,
+        })
+        if RunReport._active is self:
+            RunReport._active = None
+        if self.path:
+            folder = os.path.dirname(self.path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            with open(self.path, "a") as file:
+                for record in self.records:
+                    record = {"run_id": self.run_id, "script": self.script, **record}
+                    file.write(json.dumps(record, default=str) + "\n")
+        if self.console:
+            self.print_summary()
+
+    def print_summary(self):
+        summary = pd.DataFrame(self.records)
+        leading = [col for col in ["stage", "ticker", "interval", "rows"] if col in summary.columns]
+        summary = summary[leading + [col for col in summary.columns if col not in leading]]
+        summary["rows"] = summary["rows"].astype("Int64")
+        print(f'Run report of {self.script} ({self.run_id}), saved to {self.path}:')
+        print(summary.to_string(index=False))
+
+
+@contextmanager
+def stage(name, **fields):
+    """
+    Times a stage of the active run report.
+
+    Args:
+        name (str): Stage name, eg "tagging".
+        **fields: Fields of the record, eg ticker and interval.
+
+    Yields:
+        dict: Record of the stage. Set its "rows" to the number of rows processed.
+              "rss_growth_mb" is how much the stage raised the peak memory of the process,
+              0 if the stage stayed below the peak of the earlier stages.
+
+    Example:
+        with stage("nonevents", ticker="ZN", interval="1h") as record:
+            ...
+            record["rows"] = len(ne_filtered_data)
+    """
+    record = {"stage": name, **fields}
+    record.setdefault("rows", None)
+    wall, cpu = time.perf_counter(), time.process_time()
+    peak_rss = get_peak_rss_mb()
+    status = "failed"
+    try:
+        yield record
+        status = "ok"
+    finally:
+        record.update(
+            wall_s=round(time.perf_counter() - wall, 4),
+            cpu_s=round(time.process_time() - cpu, 4),
+            rss_growth_mb=None if peak_rss is None else round(get_peak_rss_mb() - peak_rss, 1),
+            status=status,
+        )
+        report = RunReport.get_active()
+        if report is not None:
+            report.add(record)
+
+
+def timed(name=None, **fields):
+    """
+    Decorator version of stage(). The stage is named after the function by default.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name or function.__name__, **fields):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,199 @@
+import numpy as np
+
+# Numba is optional. Without it the "numba" backend falls back to the pandas code paths.
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+KERNEL_BACKENDS = ["pandas", "numba"]
+
+
+def get_kernel_backend(kernel_backend="pandas"):
+    """
+    Resolves the requested kernel backend to the one that can run here.
+
+    Args:
+        kernel_backend (str, optional): "pandas" or "numba". Default is "pandas".
+
+    Returns:
+        str: "numba" if requested and installed, else "pandas".
+    """
+    if kernel_backend not in KERNEL_BACKENDS:
+        raise ValueError(f"Invalid kernel_backend. Use one of {KERNEL_BACKENDS}.")
+    if kernel_backend == "numba" and not NUMBA_AVAILABLE:
+        print("Numba is not installed, using the pandas kernels.")
+        return "pandas"
+    return kernel_backend
+
+
+def _aggregate_groups(group_ids, n_groups, high, low):
+    # One pass over the bars; NaN prices are skipped like in pandas max and min
+    first_row = np.full(n_groups, -1, dtype=np.int64)
+    last_row = np.full(n_groups, -1, dtype=np.int64)
+    group_high = np.full(n_groups, np.nan)
+    group_low = np.full(n_groups, np.nan)
+    bars = np.zeros(n_groups, dtype=np.int64)
+    for row in range(len(group_ids)):
+        group = group_ids[row]
+        if group < 0:
+            continue
+        if first_row[group] < 0:
+            first_row[group] = row
+        last_row[group] = row
+        bars[group] += 1
+        if not np.isnan(high[row]) and (np.isnan(group_high[group]) or high[row] > group_high[group]):
+            group_high[group] = high[row]
+        if not np.isnan(low[row]) and (np.isnan(group_low[group]) or low[row] < group_low[group]):
+            group_low[group] = low[row]
+    return first_row, last_row, group_high, group_low, bars
+
+def _mark_time_windows(bar_ns, valid, window_starts, window_ends, flags):
+    # Binary search of the latest window start before every bar, without temporary arrays
+    for row in range(len(bar_ns)):
+        if not valid[row]:
+            continue
+        position = np.searchsorted(window_starts, bar_ns[row], side="right") - 1
+        if position >= 0 and window_ends[position] >= bar_ns[row]:
+            flags[row] = 1
+    return flags
+
+
+# Python bodies of the kernels, compiled below if numba is installed, see check_kernel_equivalence
+PYTHON_KERNELS = {"_aggregate_groups": _aggregate_groups, "_mark_time_windows": _mark_time_windows}
+
+if NUMBA_AVAILABLE:
+    _aggregate_groups = njit(cache=True)(_aggregate_groups)
+    _mark_time_windows = njit(cache=True)(_mark_time_windows)
+
+
+def aggregate_groups(group_ids, n_groups, high, low):
+    """
+    First and last row, max High, min Low and row count of every group.
+
+    Args:
+        group_ids (np.ndarray): int64 group of every row, in 0..n_groups - 1, or -1 to skip the row.
+        n_groups (int): Number of groups.
+        high (np.ndarray): float64 High prices.
+        low (np.ndarray): float64 Low prices.
+
+    Returns:
+        tuple: first_row, last_row, high, low and bars arrays, one entry per group.
+    """
+    return _aggregate_groups(
+        np.ascontiguousarray(group_ids, dtype=np.int64),
+        n_groups,
+        np.ascontiguousarray(high, dtype=np.float64),
+        np.ascontiguousarray(low, dtype=np.float64),
+    )
+
+
+def mark_time_windows(bar_ns, valid, window_starts, window_ends, flags=None):
+    """
+    Sets flags to 1 for the bars inside any of the sorted [start, end] windows of equal width.
+
+    Args:
+        bar_ns (np.ndarray): int64 bar timestamps in nanoseconds.
+        valid (np.ndarray): False for the bars without a timestamp.
+        window_starts (np.ndarray): Sorted int64 window starts.
+        window_ends (np.ndarray): Sorted int64 window ends.
+        flags (np.ndarray, optional): int64 flags to update in place. Default is a new array of zeros.
+
+    Returns:
+        np.ndarray: The flags.
+    """
+    if flags is None:
+        flags = np.zeros(len(bar_ns), dtype=np.int64)
+    if len(window_starts) == 0:
+        return flags
+    return _mark_time_windows(
+        np.ascontiguousarray(bar_ns, dtype=np.int64),
+        np.ascontiguousarray(valid, dtype=np.bool_),
+        np.ascontiguousarray(window_starts, dtype=np.int64),
+        np.ascontiguousarray(window_ends, dtype=np.int64),
+        flags,
+    )
+
+
+def check_kernel_equivalence(n_bars=200000, seed=0, compiled=True):
+    """
+    Compares the numba and pandas backends of the session aggregation and the
+    event-window masking on random bars with gaps, NaN prices and missing timestamps.
+
+    Args:
+        n_bars (int): Number of random bars.
+        seed (int): Seed of the random bars and events.
+        compiled (bool): If False the "numba" backend runs the Python bodies of the kernels
+                         (PYTHON_KERNELS) instead of the compiled ones, which does not need
+                         numba but is slow, so keep n_bars small.
+
+    Returns:
+        bool: True if both backends give identical results. None if compiled and numba is
+              not installed, as the "numba" backend would only run the pandas code again.
+    """
+    if compiled and not NUMBA_AVAILABLE:
+        print("Numba is not installed, kernel equivalence not checked.")
+        return None
+
+    import tempfile
+    import pandas as pd
+    from returns import Returns
+    from nonevents import EventWindowIndex
+
+    rng = np.random.default_rng(seed)
+    minutes = np.sort(rng.choice(n_bars * 3, n_bars, replace=False))
+    timestamps = pd.Series(
+        pd.Timestamp("2023-01-01", tz="US/Eastern") + pd.to_timedelta(minutes, unit="min")
+    )
+    timestamps[rng.random(n_bars) < 0.001] = pd.NaT
+    prices = 100 + np.cumsum(rng.normal(0, 0.05, n_bars))
+    bars = pd.DataFrame(
+        {
+            "timestamp": timestamps,
+            "Open": prices,
+            "High": prices + rng.random(n_bars),
+            "Low": prices - rng.random(n_bars),
+            "Close": prices + rng.normal(0, 0.01, n_bars),
+        }
+    )
+    bars.loc[rng.random(n_bars) < 0.001, "High"] = np.nan
+
+    events = pd.DataFrame({"datetime": timestamps.dropna().sample(500, random_state=seed).sort_values()})
+    for tier_col in ["IND_Tier1", "IND_Tier2", "IND_Tier3", "IND_FED"]:
+        events[tier_col] = (rng.random(len(events)) < 0.3).astype(int)
+
+    equivalent = True
+    results = {}
+    output_folder = tempfile.mkdtemp()
+    compiled_kernels = {name: globals()[name] for name in PYTHON_KERNELS}
+    if not compiled:
+        globals().update(PYTHON_KERNELS)
+    try:
+        for kernel_backend in KERNEL_BACKENDS:
+            returns_obj = Returns(output_folder=output_folder, kernel_backend=kernel_backend)
+            event_index = EventWindowIndex(events, kernel_backend=kernel_backend)
+            # Set after the constructors, which fall back to pandas without numba
+            returns_obj.kernel_backend = event_index.kernel_backend = kernel_backend
+            df = bars.assign(session=returns_obj.get_sessions(bars["timestamp"]))
+            results[kernel_backend] = (
+                returns_obj.get_session_aggregates(df, by_session=True),
+                returns_obj.get_session_aggregates(df, by_session=False),
+                event_index.get_excluded(df["timestamp"]),
+            )
+    finally:
+        globals().update(compiled_kernels)
+    for pandas_result, numba_result in zip(results["pandas"], results["numba"]):
+        if isinstance(pandas_result, pd.DataFrame):
+            equivalent &= pandas_result.equals(numba_result)
+        else:
+            equivalent &= np.array_equal(pandas_result, numba_result)
+    return bool(equivalent)
+
+
+if __name__ == "__main__":
+    print(f"Numba available: {NUMBA_AVAILABLE}")
+    if NUMBA_AVAILABLE:
+        print(f"Numba and pandas kernels equivalent: {check_kernel_equivalence()}")
+    else:
+        print(f"Python kernels and pandas equivalent: {check_kernel_equivalence(n_bars=20000, compiled=False)}")
@@ -0,0 +1,313 @@
+import os
+import json
+import hashlib
+
+# Name of the manifest file kept inside every data and output folder
+MANIFEST_FILE = "manifest.json"
+
+
+def get_file_hash(path, chunk_size=1 << 20):
+    """
+    SHA-256 of the content of a file, read in chunks.
+    """
+    file_hash = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def parse_file_name(name):
+    """
+    Gets the kind, ticker, interval and other fields of a data or output file from
+    its name, following the naming of the files written by this project.
+
+    Args:
+        name (str): File name relative to its manifest folder, eg "print/ZN_1h_Returns_Distribution.png".
+
+    Returns:
+        dict: Fields of the file. kind is "other" for names that do not follow the conventions.
+    """
+    folder, file_name = os.path.split(name)
+    # Subfolder of the render profile, eg "print", or "" for the folder itself
+    fields = {"profile": folder}
+    stem, extension = os.path.splitext(file_name)
+    parts = stem.split("_")
+
+    if file_name.startswith("Intraday_data_") and len(parts) == 7:
+        # Intraday_data_{ticker}_{interval}_{start}_to_{end}.csv
+        fields.update(kind="intraday_data", ticker=parts[2], interval=parts[3], start_date=parts[4], end_date=parts[6])
+    elif file_name.startswith("EconomicEvents"):
+        fields.update(kind="events")
+    elif stem.endswith("_events_tagged_target_tz") or stem.endswith("_events_tagged_target_tz_nonevents"):
+        # {ticker}_{interval}[_filtered_dates]_events_tagged_target_tz[_nonevents].csv
+        fields.update(
+            kind="nonevents" if stem.endswith("_nonevents") else "events_tagged",
+            ticker=parts[0],
+            interval=parts[1],
+            filtered="_filtered_dates_" in stem,
+        )
+    elif "_latest_custom_days_" in stem:
+        # {session}_latest_custom_days_Volatility_Returns_{interval}_{ticker}[_stats].csv
+        session, details = stem.split("_latest_custom_days_", maxsplit=1)
+        details = details.split("_")
+        is_stats = details[-1] == "stats"
+        if is_stats:
+            details = details[:-1]
+        fields.update(
+            kind="latest_custom_days_stats" if is_stats else "latest_custom_days",
+            ticker=details[-1],
+            interval=details[-2],
+            return_type=details[0],
+            session=session,
+        )
+    elif stem.endswith("_Distribution") and extension in [".png", ".webp"]:
+        # {ticker}_{interval}_{Returns|Volatility}_Distribution.{png|webp}
+        fields.update(kind="plot", ticker=parts[0], interval=parts[1], return_type=parts[2])
+    elif stem.endswith("_stats") and len(parts) >= 4:
+        # {ticker}_{interval}_{Returns|Volatility_Returns|Seasonal_Windows}_stats.csv
+        fields.update(kind="stats", ticker=parts[0], interval=parts[1], return_type=parts[2])
+    else:
+        fields.update(kind="other")
+    return fields
+
+
+class FileManifest:
+    """
+    Record of the files in a data or output folder: kind, ticker, interval, date range,
+    row count, size and content hash of every file, kept in a json file in the folder.
+
+    Files are recorded when they are written, so consumers look them up by
+    (kind, ticker, interval) instead of scanning the folder and splitting file
+    names. A folder without a manifest is scanned once to build it. Records of
+    files changed or deleted since they were recorded are updated on lookup.
+
+    Consumers that only read the folder, eg the Streamlit app, open the manifest
+    with read_only=True: it is never written and the files are not hashed.
+    """
+    # One manifest object per folder in a process, see FileManifest.open
+    _open_manifests = {}
+    # Records kept back in a worker process, see FileManifest.defer_records
+    _deferred_records = None
+
+    def __init__(self, folder, read_only=False):
+        self.folder = folder
+        self.read_only = read_only
+        self.path = os.path.join(folder, MANIFEST_FILE)
+        self.records = {}
+        self.index = {}
+        if os.path.exists(self.path):
+            with open(self.path) as file:
+                for record in json.load(file):
+                    self._add(record)
+        else:
+            self.refresh()
+
+    def __str__(self):
+        return f'FileManifest of {self.folder} with {len(self.records)} files'
+
+    @classmethod
+    def open(cls, folder):
+        """
+        Gets the manifest of a folder, loading it on first use.
+        """
+        key = os.path.abspath(folder)
+        if key not in cls._open_manifests:
+            os.makedirs(folder, exist_ok=True)
+            cls._open_manifests[key] = cls(folder)
+        return cls._open_manifests[key]
+
+    @classmethod
+    def defer_records(cls):
+        """
+        Keeps the records of this process in memory instead of writing the manifests,
+        eg in the workers of a process pool, so that only the parent process writes
+        them. See FileManifest.collect_deferred_records.
+        """
+        cls._deferred_records = []
+
+    @classmethod
+    def collect_deferred_records(cls):
+        """
+        Returns:
+            list: (folder, path, rows, fields) of the files recorded since the last call,
+                  to be passed to FileManifest.open(folder).record in the parent process.
+        """
+        records = cls._deferred_records or []
+        if cls._deferred_records is not None:
+            cls._deferred_records = []
+        return records
+
+    def _add(self, record):
+        if record["name"] in self.records:
+            self._remove(record["name"])
+        self.records[record["name"]] = record
+        key = (record.get("kind"), record.get("ticker"), record.get("interval"))
+        self.index.setdefault(key, []).append(record["name"])
+
+    def _remove(self, name):
+        record = self.records.pop(name)
+        key = (record.get("kind"), record.get("ticker"), record.get("interval"))
+        self.index[key].remove(name)
+
+    def save(self):
+        if self.read_only or FileManifest._deferred_records is not None:
+            return
+        with open(self.path, "w") as file:
+            json.dump(sorted(self.records.values(), key=lambda x: x["name"]), file, indent=1)
+
+    def _describe_file(self, name, rows=None, **fields):
+        path = os.path.join(self.folder, name)
+        record = {"name": name}
+        record.update(parse_file_name(name))
+        record.update(fields)
+        if rows is None and name.endswith(".csv") and not self.read_only:
+            with open(path, "rb") as file:
+                rows = max(sum(1 for _ in file) - 1, 0)
+        record["rows"] = rows
+        record["size"] = os.path.getsize(path)
+        # Read-only manifests are not saved, so the row count and the hash would only slow down the lookups
+        record["sha256"] = None if self.read_only else get_file_hash(path)
+        return record
+
+    def _is_stale(self, record):
+        """
+        Checks if a recorded file changed since it was recorded, from its size. The
+        mtime is not compared, as every checkout of the repository gives the files a
+        new one. Files rewritten by this project are recorded again when written.
+        """
+        return record.get("size") != os.path.getsize(self.get_path(record))
+
+    def _describe_again(self, record):
+        # Describes a changed file again, keeping the fields given when it was recorded
+        # mtime is dropped from the records written before it was removed
+        computed = {"name", "rows", "size", "mtime", "sha256"} | set(parse_file_name(record["name"]))
+        fields = {key: value for key, value in record.items() if key not in computed}
+        record = self._describe_file(record["name"], **fields)
+        self._add(record)
+        return record
+
+    def _update_stale(self, records):
+        """
+        Drops the records of deleted files and describes the changed files again.
+
+        Returns:
+            tuple: Records of the existing files, and True if a recorded file was deleted.
+        """
+        current = []
+        missing = False
+        changed = False
+        for record in records:
+            if not os.path.exists(self.get_path(record)):
+                self._remove(record["name"])
+                missing = changed = True
+                continue
+            if self._is_stale(record):
+                record = self._describe_again(record)
+                changed = True
+            current.append(record)
+        if changed:
+            self.save()
+        return current, missing
+
+    def record(self, path, rows=None, **fields):
+        """
+        Records a file that was just written and saves the manifest.
+
+        Args:
+            path (str): Path of the file inside the manifest folder (subfolders allowed).
+            rows (int, optional): Row count of the data. Counted from the file for csv files if not given.
+            **fields: Fields overriding the ones parsed from the file name, eg start_date and end_date.
+
+        Returns:
+            dict: Record of the file, or None if records are deferred in this process.
+        """
+        if FileManifest._deferred_records is not None:
+            FileManifest._deferred_records.append((self.folder, path, rows, fields))
+            return None
+        name = os.path.relpath(path, self.folder).replace(os.sep, "/")
+        record = self._describe_file(name, rows=rows, **fields)
+        self._add(record)
+        self.save()
+        return record
+
+    def delete(self, record):
+        """
+        Deletes a recorded file and drops its record from the manifest.
+        """
+        path = self.get_path(record)
+        if os.path.exists(path):
+            os.remove(path)
+        self._remove(record["name"])
+        self.save()
+
+    def refresh(self):
+        """
+        Scans the folder once: records new or changed files and drops the deleted ones.
+        """
+        found = set()
+        for root, _, files in os.walk(self.folder):
+            for file_name in files:
+                if file_name == MANIFEST_FILE:
+                    continue
+                name = os.path.relpath(os.path.join(root, file_name), self.folder).replace(os.sep, "/")
+                found.add(name)
+                record = self.records.get(name)
+                if record is None:
+                    self._add(self._describe_file(name))
+                elif self._is_stale(record):
+                    self._describe_again(record)
+        for name in set(self.records) - found:
+            self._remove(name)
+        if os.path.isdir(self.folder):
+            self.save()
+
+    def find(self, kind=None, ticker=None, interval=None, **fields):
+        """
+        Records matching all the given fields. kind, ticker and interval are looked up
+        in the index, the other fields are compared on the matching records only.
+        The sizes of the matching files are checked against the records.
+
+        Returns:
+            list: Matching records sorted by name.
+        """
+        return self._update_stale(self._lookup(kind, ticker, interval, **fields))[0]
+
+    def _lookup(self, kind=None, ticker=None, interval=None, **fields):
+        if kind is not None and ticker is not None and interval is not None:
+            records = [self.records[name] for name in self.index.get((kind, ticker, interval), [])]
+        else:
+            records = [
+                record for record in self.records.values()
+                if all(value is None or record.get(key) == value
+                       for key, value in [("kind", kind), ("ticker", ticker), ("interval", interval)])
+            ]
+        records = [record for record in records if all(record.get(key) == value for key, value in fields.items())]
+        return sorted(records, key=lambda x: x["name"])
+
+    def get(self, kind, ticker, interval, **fields):
+        """
+        Latest recorded file of a (kind, ticker, interval), eg the data file of ZN 1h.
+        The folder is scanned again if the recorded file was deleted or renamed.
+
+        Returns:
+            dict: Record of the file, or None if there is no such file.
+        """
+        records, missing = self._update_stale(self._lookup(kind, ticker, interval, **fields))
+        if missing:
+            self.refresh()
+            records = self._lookup(kind, ticker, interval, **fields)
+        return records[-1] if records else None
+
+    def get_record(self, path):
+        """
+        Record of the file at path, checked against its size like find. None if it is not recorded.
+        """
+        name = os.path.relpath(path, self.folder).replace(os.sep, "/")
+        if name not in self.records:
+            return None
+        records, _ = self._update_stale([self.records[name]])
+        return records[0] if records else None
+
+    def get_path(self, record):
+        return os.path.join(self.folder, record["name"])
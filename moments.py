@@ -0,0 +1,154 @@
+import numpy as np
+import pandas as pd
+
+
+def _zero_out_fperr(value):
+    # Same tolerance as pandas, so that constant series give 0 skew and kurtosis
+    return 0.0 if abs(value) < 1e-14 else value
+
+
+class MomentAccumulator:
+    """
+    Count, mean and central moment sums (M2, M3, M4) of a series of values.
+
+    Accumulators of different date ranges, sessions or tickers can be merged
+    exactly, so statistics of a growing series only need the new values.
+    mean, std, skew and kurtosis follow the pandas definitions of
+    .mean(), .std(), .skew() and .kurtosis() (sample std, adjusted
+    Fisher-Pearson skewness and excess kurtosis).
+    """
+    def __init__(self, count=0, mean=0.0, m2=0.0, m3=0.0, m4=0.0):
+        self.count = int(count)
+        self.mean_value = float(mean)
+        self.m2 = float(m2)
+        self.m3 = float(m3)
+        self.m4 = float(m4)
+
+    def __str__(self):
+        return f'MomentAccumulator(count={self.count}, mean={self.mean_value}, M2={self.m2}, M3={self.m3}, M4={self.m4})'
+
+    @classmethod
+    def from_values(cls, values):
+        """
+        Builds the accumulator of an array of values. NaN values are ignored.
+        """
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return cls()
+        mean = values.mean()
+        deviation = values - mean
+        deviation2 = deviation**2
+        return cls(
+            len(values),
+            mean,
+            deviation2.sum(),
+            (deviation2 * deviation).sum(),
+            (deviation2**2).sum(),
+        )
+
+    @classmethod
+    def from_groups(cls, values, groups):
+        """
+        Builds one accumulator per group in a single grouped pass.
+
+        Args:
+            values (pd.Series): Values. NaN values are ignored.
+            groups (pd.Series or list): Group keys aligned with values, as accepted by groupby.
+
+        Returns:
+            dict: Group key mapped to its MomentAccumulator.
+        """
+        values = pd.Series(values, dtype=float)
+        grouped = values.groupby(groups, observed=True, sort=False)
+        deviation = values - grouped.transform("mean")
+        deviation2 = deviation**2
+        sums = pd.DataFrame(
+            {
+                "count": grouped.count(),
+                "mean": grouped.mean(),
+                "m2": deviation2.groupby(groups, observed=True, sort=False).sum(),
+                "m3": (deviation2 * deviation).groupby(groups, observed=True, sort=False).sum(),
+                "m4": (deviation2**2).groupby(groups, observed=True, sort=False).sum(),
+            }
+        )
+        return {
+            key: cls(row["count"], row["mean"], row["m2"], row["m3"], row["m4"])
+            if row["count"] > 0 else cls()
+            for key, row in sums.iterrows()
+        }
+
+    def merge(self, other):
+        """
+        Combines two accumulators as if their values were in one series.
+
+        Args:
+            other (MomentAccumulator): Accumulator of the other values.
+
+        Returns:
+            MomentAccumulator: New accumulator of all the values.
+        """
+        if other.count == 0:
+            return MomentAccumulator(self.count, self.mean_value, self.m2, self.m3, self.m4)
+        if self.count == 0:
+            return MomentAccumulator(other.count, other.mean_value, other.m2, other.m3, other.m4)
+
+        n_a, n_b = self.count, other.count
+        n = n_a + n_b
+        delta = other.mean_value - self.mean_value
+        mean = self.mean_value + delta * n_b / n
+        m2 = self.m2 + other.m2 + delta**2 * n_a * n_b / n
+        m3 = (
+            self.m3 + other.m3
+            + delta**3 * n_a * n_b * (n_a - n_b) / n**2
+            + 3 * delta * (n_a * other.m2 - n_b * self.m2) / n
+        )
+        m4 = (
+            self.m4 + other.m4
+            + delta**4 * n_a * n_b * (n_a**2 - n_a * n_b + n_b**2) / n**3
+            + 6 * delta**2 * (n_a**2 * other.m2 + n_b**2 * self.m2) / n**2
+            + 4 * delta * (n_a * other.m3 - n_b * self.m3) / n
+        )
+        return MomentAccumulator(n, mean, m2, m3, m4)
+
+    def update(self, values):
+        """
+        Adds new values in place, eg the returns of the new days.
+        """
+        merged = self.merge(MomentAccumulator.from_values(values))
+        self.count, self.mean_value = merged.count, merged.mean_value
+        self.m2, self.m3, self.m4 = merged.m2, merged.m3, merged.m4
+        return self
+
+    def to_list(self):
+        return [self.count, self.mean_value, self.m2, self.m3, self.m4]
+
+    @classmethod
+    def from_list(cls, values):
+        return cls(*values)
+
+    def mean(self):
+        return self.mean_value if self.count > 0 else np.nan
+
+    def std(self):
+        return np.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else np.nan
+
+    def skew(self):
+        if self.count < 3:
+            return np.nan
+        m2, m3 = _zero_out_fperr(self.m2), _zero_out_fperr(self.m3)
+        if m2 == 0:
+            return 0.0
+        n = self.count
+        return (n * (n - 1) ** 0.5 / (n - 2)) * (m3 / m2**1.5)
+
+    def kurtosis(self):
+        if self.count < 4:
+            return np.nan
+        n = self.count
+        numerator = _zero_out_fperr(n * (n + 1) * (n - 1) * self.m4)
+        denominator = _zero_out_fperr((n - 2) * (n - 3) * self.m2**2)
+        if denominator == 0:
+            return 0.0
+        adjustment = 3 * (n - 1) ** 2 / ((n - 2) * (n - 3))
+        return numerator / denominator - adjustment
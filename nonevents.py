@@ -1,5 +1,14 @@
 import pandas as pd
 import numpy as np
+import kernels
+
+# Exclusion window applied on both sides of the timed events
+NONEVENT_TIME_WINDOWS = {
+    'IND_Tier2': pd.Timedelta(minutes=30),
+    'IND_Tier3': pd.Timedelta(minutes=15),
+    'IND_FED': pd.Timedelta(minutes=30),
+}
+
 class Nonevents:
     """
     Filters the data based on events and non events
@@ -8,8 +17,60 @@ class Nonevents:
     def __init__(self,dataframe):
         self.dataframe=dataframe
 
-    def filter_nonevents(self,df):
+    @staticmethod
+    def build_time_windows(event_timestamps, time_window):
+        """
+        Builds sorted [start, end] exclusion windows around event timestamps.
+
+        Args:
+            event_timestamps (pd.Series): Timestamps of the flagged events.
+            time_window (pd.Timedelta): Window applied on both sides of every event.
+
+        Returns:
+            tuple: Sorted int64 (nanosecond) arrays of window starts and window ends.
+        """
+        event_times = pd.DatetimeIndex(pd.to_datetime(event_timestamps)).dropna()
+        event_times = np.sort(event_times.as_unit('ns').asi8)
+        window_ns = pd.Timedelta(time_window).value
+        return (event_times - window_ns, event_times + window_ns)
+
+    @staticmethod
+    def mark_time_windows(timestamps, window_starts, window_ends):
+        """
+        Marks the timestamps that fall inside any of the [start, end] windows.
+
+        All windows share the same width, so the window with the latest start
+        before a timestamp also has the latest end. One binary search per bar
+        is enough, which keeps the cost at O((rows + events) log events).
+
+        Args:
+            timestamps (pd.Series): Bar timestamps to be checked.
+            window_starts (np.ndarray): Sorted window starts from build_time_windows.
+            window_ends (np.ndarray): Sorted window ends from build_time_windows.
+
+        Returns:
+            np.ndarray: 1 where the bar lies within a window, else 0.
+        """
+        bar_times = pd.DatetimeIndex(pd.to_datetime(timestamps))
+        flags = np.zeros(len(bar_times), dtype=int)
+        if len(window_starts) == 0:
+            return flags
+
+        valid = ~bar_times.isna()
+        bar_ns = bar_times.as_unit('ns').asi8[valid]
+        position = np.searchsorted(window_starts, bar_ns, side='right') - 1
+        within_window = (position >= 0) & (window_ends[np.maximum(position, 0)] >= bar_ns)
+        flags[valid] = within_window
+        return flags
+
+    def filter_nonevents(self,df,event_index=None):
         df['timestamp'] = pd.to_datetime(df['timestamp'])  # Ensure timestamp is datetime
+
+        # Use the prebuilt windows of all the events instead of rediscovering them from df
+        if event_index is not None:
+            df['IND_NE_remove'] = event_index.get_excluded(df['timestamp'])
+            return df
+
         df['date'] = df['timestamp'].dt.date  # Extract date
         df['IND_NE_remove'] = 0  # Initialize with 0
 
@@ -19,24 +80,88 @@ class Nonevents:
 
         # Handle time windows for IND_Tier2, IND_Tier3, and IND_FED
         def flag_time_window(tier_col, time_window):
-            flags = np.zeros(len(df), dtype=int)
-            for _, row in df.iterrows():
-                if row[tier_col] == 1:
-                    start_time = row['timestamp'] - time_window
-                    end_time = row['timestamp'] + time_window
-                    within_window = (df['timestamp'] >= start_time) & (df['timestamp'] <= end_time)
-                    flags |= (within_window).values #bit-wise or
-            return flags
+            window_starts, window_ends = self.build_time_windows(
+                df.loc[df[tier_col] == 1, 'timestamp'], time_window
+            )
+            return self.mark_time_windows(df['timestamp'], window_starts, window_ends)
 
         # Apply time-based flagging
-        df['ind_tier2'] = flag_time_window('IND_Tier2', pd.Timedelta(minutes=30))
-        df['ind_tier3'] = flag_time_window('IND_Tier3', pd.Timedelta(minutes=15))
-        df['ind_fed'] = flag_time_window('IND_FED', pd.Timedelta(minutes=30))
+        df['ind_tier2'] = flag_time_window('IND_Tier2', NONEVENT_TIME_WINDOWS['IND_Tier2'])
+        df['ind_tier3'] = flag_time_window('IND_Tier3', NONEVENT_TIME_WINDOWS['IND_Tier3'])
+        df['ind_fed'] = flag_time_window('IND_FED', NONEVENT_TIME_WINDOWS['IND_FED'])
 
         # Combine all flags
         df['IND_NE_remove'] = df[['IND_NE_remove', 'ind_tier2', 'ind_tier3', 'ind_fed']].max(axis=1)
 
         # Clean up intermediate columns
         df.drop(['ind_tier2', 'ind_tier3', 'ind_fed', 'date'], axis=1, inplace=True)
-        
-        return df
\ No newline at end of file
+
+        return df
+
+
+class EventWindowIndex:
+    """
+    Exclusion windows of the economic events, built once from the processed
+    events file and shared by every (ticker, interval) price series.
+
+    Holds the sorted [start, end] windows of each timed tier and the dates
+    of the Tier 1 events, which are excluded for the entire day. With the "numba"
+    kernel backend the windows are marked by a compiled kernel in place.
+    """
+    def __init__(self, events_df, timestamp_col='datetime', tier_windows=None, target_tz='US/Eastern', kernel_backend='pandas'):
+        if tier_windows is None:
+            tier_windows = NONEVENT_TIME_WINDOWS
+        self.kernel_backend = kernels.get_kernel_backend(kernel_backend)
+
+        event_times = pd.to_datetime(events_df[timestamp_col])
+        if not pd.api.types.is_datetime64_any_dtype(event_times):
+            # Offsets change with DST when the events are read back from csv
+            event_times = pd.to_datetime(events_df[timestamp_col], utc=True).dt.tz_convert(target_tz)
+        self.tz = event_times.dt.tz
+
+        self.tier_windows = {}
+        for tier_col, time_window in tier_windows.items():
+            self.tier_windows[tier_col] = Nonevents.build_time_windows(
+                event_times[events_df[tier_col] == 1], time_window
+            )
+
+        self.tier1_days = np.unique(self._get_days(event_times[events_df['IND_Tier1'] == 1].dropna()))
+
+    def __str__(self):
+        windows = {tier_col: len(starts) for tier_col, (starts, _) in self.tier_windows.items()}
+        return f'EventWindowIndex with {len(self.tier1_days)} Tier1 dates and windows {windows}'
+
+    def _get_days(self, timestamps):
+        """
+        Converts timestamps to calendar days in the timezone of the events.
+        """
+        timestamps = pd.to_datetime(timestamps)
+        if timestamps.dt.tz is not None and self.tz is not None:
+            timestamps = timestamps.dt.tz_convert(self.tz)
+        if timestamps.dt.tz is not None:
+            timestamps = timestamps.dt.tz_localize(None)
+        return timestamps.values.astype('datetime64[D]')
+
+    def get_excluded(self, timestamps):
+        """
+        Checks which bar timestamps fall on a Tier 1 date or inside an event window.
+
+        Args:
+            timestamps (pd.Series): Bar timestamps of any price series.
+
+        Returns:
+            np.ndarray: 1 where the bar has to be removed, else 0.
+        """
+        timestamps = pd.Series(pd.to_datetime(timestamps))
+        excluded = np.isin(self._get_days(timestamps), self.tier1_days).astype(np.int64)
+        if self.kernel_backend == 'numba':
+            bar_times = pd.DatetimeIndex(timestamps)
+            bar_ns = bar_times.as_unit('ns').asi8
+            valid = ~bar_times.isna()
+            for window_starts, window_ends in self.tier_windows.values():
+                kernels.mark_time_windows(bar_ns, valid, window_starts, window_ends, excluded)
+            return excluded
+
+        for window_starts, window_ends in self.tier_windows.values():
+            excluded |= Nonevents.mark_time_windows(timestamps, window_starts, window_ends)
+        return excluded
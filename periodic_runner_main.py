@@ -4,6 +4,8 @@ import shutil #deleting directories
 import pandas as pd
 from intradaydata import Intraday
 from preprocessing import ManipulateTimezone
+from manifest import FileManifest
+from instrumentation import RunReport, stage
 
 
 
@@ -30,7 +32,9 @@ def _save_data(Intraday_data_files,
               mysymboldict,
             
              ):
-    alldatadict=IntradayObject.fetch_data_yfinance(specific_tickers=IntradayObject.tickers) #Get dictionary of specific intraday data that we want to store
+    with stage('fetch',interval=return_interval) as record:
+        alldatadict=IntradayObject.fetch_data_yfinance(specific_tickers=IntradayObject.tickers) #Get dictionary of specific intraday data that we want to store
+        record['rows']=sum(len(data) for data in alldatadict.values())
     #print(start_date,end_date)
     #print(alldatadict)
     ## In the "temp" folder, merge the new data with old data (old data is present in "Intraday_data_files")
@@ -60,56 +64,56 @@ def _save_data(Intraday_data_files,
             newcsv=pd.DataFrame()
 
     
-        flag=0
-        for entry2 in os.scandir(Intraday_data_files):
-            if entry2.is_file() and entry2.name.endswith('.csv') and 'stats' not in entry2.name:
-               
-                [_,_,ticker,interval,oldstart,_,oldend]=(entry2.name.replace('.csv',"")).split('_')
-                if ticker==symbol and interval==return_interval:
-                    oldcsvpath=os.path.join(Intraday_data_files,entry2.name)
-                    oldcsv=pd.read_csv(oldcsvpath)
-                    if 'Datetime' in list(oldcsv.columns):#index is in 0...... and not Datetime format->cause error in merging
-                        oldcsv.index.name='Datetime'
-                        oldcsv.columns.name='Price'
-                        oldcsv.index=oldcsv['Datetime']
-                        oldcsv.drop(columns=['Datetime'],axis=1,inplace=True)
-                    flag=1
-                    break
-                else:
-                    continue
-        if flag==0:
-            oldcsv=pd.DataFrame()
-            print(f'Historical data for {symbol} not found.')
+        with stage('merge',ticker=symbol,interval=return_interval) as record:
+            flag=0
+            # Look up the historical data file in the manifest instead of scanning the folder
+            data_manifest=FileManifest.open(Intraday_data_files)
+            old_record=data_manifest.get('intraday_data',symbol,return_interval)
+            if old_record is not None:
+                oldcsvpath=data_manifest.get_path(old_record)
+                oldcsv=pd.read_csv(oldcsvpath)
+                if 'Datetime' in list(oldcsv.columns):#index is in 0...... and not Datetime format->cause error in merging
+                    oldcsv.index.name='Datetime'
+                    oldcsv.columns.name='Price'
+                    oldcsv.index=oldcsv['Datetime']
+                    oldcsv.drop(columns=['Datetime'],axis=1,inplace=True)
+                flag=1
+            if flag==0:
+                oldcsv=pd.DataFrame()
+                print(f'Historical data for {symbol} not found.')
     
-        if newcsv.empty and oldcsv.empty:
-            print(f"No data available for {symbol}. Both old and new data are empty.")
-            finalcsv = pd.DataFrame()  # Create an empty DataFrame
+            if newcsv.empty and oldcsv.empty:
+                print(f"No data available for {symbol}. Both old and new data are empty.")
+                finalcsv = pd.DataFrame()  # Create an empty DataFrame
         
-        elif newcsv.empty:
-            print(f"No new data fetched for {symbol}. Using only historical data.")
-            finalcsv = oldcsv.copy()  # Use only the historical data
+            elif newcsv.empty:
+                print(f"No new data fetched for {symbol}. Using only historical data.")
+                finalcsv = oldcsv.copy()  # Use only the historical data
     
-        elif oldcsv.empty:
-            print(f"No historical data found for {symbol}. Using only new data.")
-            finalcsv = newcsv.copy()  # Use only the new data
+            elif oldcsv.empty:
+                print(f"No historical data found for {symbol}. Using only new data.")
+                finalcsv = newcsv.copy()  # Use only the new data
     
-        else:
-            finalcsv = pd.concat([oldcsv,newcsv])
+            else:
+                finalcsv = pd.concat([oldcsv,newcsv])
         
-        finalcsv.drop_duplicates(inplace=True)
-        finalcsv.dropna(inplace=True,how='all') 
-        finalcsv.index = pd.to_datetime(finalcsv.index)
-        finalcsv.sort_index(inplace=True)
-        finalcsv.drop_duplicates(inplace=True)
-        finalcsv.dropna(inplace=True,how='all') 
-        finalcsv = finalcsv.loc[~finalcsv.index.duplicated(keep='last')]
-
-
-        finalstart=str(finalcsv.index.to_list()[0])[:10]
-        finalend=str(finalcsv.index.to_list()[-1])[:10]
-        finalpath=os.path.join('temp',f'Intraday_data_{symbol}_{return_interval}_{finalstart}_to_{finalend}.csv')
-        finalcsv=_add_target_tz_col(finalcsv,current_tz='UTC',final_tz='US/Eastern',tickerinterval=return_interval)
-        finalcsv.to_csv(finalpath,index=True)
+            finalcsv.drop_duplicates(inplace=True)
+            finalcsv.dropna(inplace=True,how='all') 
+            finalcsv.index = pd.to_datetime(finalcsv.index)
+            finalcsv.sort_index(inplace=True)
+            finalcsv.drop_duplicates(inplace=True)
+            finalcsv.dropna(inplace=True,how='all') 
+            finalcsv = finalcsv.loc[~finalcsv.index.duplicated(keep='last')]
+
+
+            finalstart=str(finalcsv.index.to_list()[0])[:10]
+            finalend=str(finalcsv.index.to_list()[-1])[:10]
+            finalpath=os.path.join('temp',f'Intraday_data_{symbol}_{return_interval}_{finalstart}_to_{finalend}.csv')
+            finalcsv=_add_target_tz_col(finalcsv,current_tz='UTC',final_tz='US/Eastern',tickerinterval=return_interval)
+            finalcsv.to_csv(finalpath,index=True)
+            # "temp" becomes "Intraday_data_files" at the end of the run, along with its manifest
+            FileManifest.open('temp').record(finalpath,rows=len(finalcsv),start_date=finalstart,end_date=finalend)
+            record['rows']=len(finalcsv)
         # #print(f'Old CSV for {symbol}')
         # #print(f'New CSV for {symbol}')
         # print(f'Combined CSV for {symbol}')
@@ -171,6 +175,8 @@ if __name__=='__main__':
     os.makedirs('temp',exist_ok=True) # Temporary file to hold new Intraday data. Later gets renamed to "Intraday_data_files" after new and old data gets Merged
     
     
+    # Timings of every stage are appended to logs/run_report.jsonl and summarised at the end
+    report = RunReport('periodic_runner_main').start()
     # Case:1
     runner(start=-1,
            end=-1,
@@ -235,3 +241,4 @@ if __name__=='__main__':
         print("You do not have permission to rename this directory.")
     except Exception as e:
         print(f"An error occurred: {e}")
+    report.finish()
@@ -7,7 +7,8 @@ class ManipulateTimezone:
     def __init__(self,data):
         self.dataframe=pd.DataFrame(data)
 
-    def _check_timezone(self, checkdf="", tz_col="", default_tz = "Asia/Kolkata", target_tz = "US/Eastern"):
+    def _check_timezone(self, checkdf="", tz_col="", default_tz = "Asia/Kolkata", target_tz = "US/Eastern",
+                        ambiguous="raise", nonexistent="raise"):
         """
         Checks the timezone of a timestamp column in the DataFrame and 
         converts it to target timezone
@@ -16,6 +17,10 @@ class ManipulateTimezone:
             dataframe (pd.DataFrame): Instrument Data with intra-day data in a Pandas DataFrame.
             tz_col (str, optional): Name of the column containing datetime values.
                                     If not provided, the method will attempt to detect it.
+            ambiguous (str, optional): How to localize naive times repeated at the end of DST.
+                                       Passed to pandas tz_localize. Default is "raise".
+            nonexistent (str, optional): How to localize naive times skipped at the start of DST.
+                                         Passed to pandas tz_localize. Default is "raise".
 
         Returns:
             pd.DataFrame: DataFrame with the timezone converted to US/Eastern.
@@ -37,9 +42,42 @@ class ManipulateTimezone:
         dataframe[tz_col]=pd.to_datetime(dataframe[tz_col])
 
         # Apply timezone conversion
-        dataframe[tz_col]=dataframe[tz_col].apply(
-            lambda tz_info:self._convert_timezone(tz_info,default_tz,target_tz))
+        dataframe[tz_col]=self._convert_timezone_column(
+            dataframe[tz_col],default_tz,target_tz,ambiguous,nonexistent)
         return dataframe
+
+    def _convert_timezone_column(self, tz_series, default_tz, target_tz, ambiguous="raise", nonexistent="raise"):
+        """
+        Converts a whole timestamp column to the target timezone in one operation.
+
+        Args:
+            tz_series (pd.Series): Column of datetime values.
+            default_tz (str): The default timezone to localize naive timestamps.
+            target_tz (str): The target timezone for conversion.
+            ambiguous (str, optional): Handling of ambiguous DST times while localizing.
+            nonexistent (str, optional): Handling of nonexistent DST times while localizing.
+
+        Returns:
+            pd.Series: Column converted to the target timezone.
+        """
+        # Timezone-aware column
+        if isinstance(tz_series.dtype, pd.DatetimeTZDtype):
+            return tz_series.dt.tz_convert(target_tz)
+
+        # Timezone-naive column
+        if pd.api.types.is_datetime64_dtype(tz_series):
+            return tz_series.dt.tz_localize(
+                default_tz, ambiguous=ambiguous, nonexistent=nonexistent
+            ).dt.tz_convert(target_tz)
+
+        # Mixed UTC offsets (eg. across DST) are parsed as an object column
+        is_aware = tz_series.map(lambda tz_info: getattr(tz_info, 'tzinfo', None) is not None)
+        if is_aware.all():
+            return pd.to_datetime(tz_series, utc=True).dt.tz_convert(target_tz)
+
+        # Mix of naive and aware timestamps
+        return tz_series.apply(
+            lambda tz_info:self._convert_timezone(tz_info,default_tz,target_tz))
     
     @staticmethod
     def _convert_timezone(tz_info, default_tz, target_tz):
@@ -60,17 +98,35 @@ class ManipulateTimezone:
         return tz_info
     
 
-    def change_timezone(self,checkdf,tz_col, default_tz,target_tz):
-        return self._check_timezone(checkdf,tz_col, default_tz,target_tz)
+    def change_timezone(self,checkdf,tz_col, default_tz,target_tz,ambiguous="raise",nonexistent="raise"):
+        return self._check_timezone(checkdf,tz_col, default_tz,target_tz,ambiguous,nonexistent)
     
 
     @staticmethod
-    def add_time_for_d_intervals(day_interval_dataframe,target_col):
+    def add_time_for_d_intervals(day_interval_dataframe,target_col,end_of_day="23:59:59"):
+        """
+        Stamps the daily bars with the end of day time.
+
+        Args:
+            day_interval_dataframe (pd.DataFrame): Data with 1d interval.
+            target_col (str): Name of the column containing the dates.
+            end_of_day (str or pd.Timedelta, optional): Time of day ("hh:mm:ss") given to every bar. Default is "23:59:59".
+
+        Returns:
+            pd.DataFrame: Data with the time of every row changed to end_of_day.
+        """
         # Convert 1d interval dataframe to datetime. It adds  00:00:00 by default since no time value.
         day_interval_dataframe[target_col] = pd.to_datetime(day_interval_dataframe[target_col], errors='coerce')
+        day_col = day_interval_dataframe[target_col]
+        day_offset = pd.Timedelta(end_of_day)
 
-        # Change time of rows to 23:59:59
-        day_interval_dataframe[target_col] = day_interval_dataframe[target_col].apply(lambda x: x.replace(hour=23, minute=59, second=59))
+        # Change time of rows to end_of_day (23:59:59 by default) as wall time of the column's timezone
+        if isinstance(day_col.dtype, pd.DatetimeTZDtype):
+            day_interval_dataframe[target_col] = (
+                day_col.dt.tz_localize(None).dt.normalize() + day_offset
+            ).dt.tz_localize(day_col.dt.tz)
+        else:
+            day_interval_dataframe[target_col] = day_col.dt.normalize() + day_offset
         
         return day_interval_dataframe
     
@@ -1,18 +1,22 @@
-import seaborn as sns
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-import os
 from returns_main import folder_processed
+from density import binned_kde
+from manifest import FileManifest
+from frame_store import FrameStore
+from instrumentation import RunReport, stage
 
 def GetMatrix(target_bps,target_hrs,interval,ticker_name,version='NA'):
     df=pd.DataFrame()
-    # Scan the desired folder for the non-events file with 1 hr interval and converted to target timezone
-    for file in os.scandir(folder_processed):
-       if file.is_file():
-          print(file.name)
-          if all(x in str(file.name) for x in [interval, ticker_name, 'nonevents','target_tz']) and file.name.endswith('.csv'):
-             df=pd.read_csv(os.path.join(folder_processed,file.name))
+    # Look up the non-events file of the ticker and interval, converted to target timezone, in the manifest
+    processed_manifest=FileManifest(folder_processed,read_only=True) # Read again on every call, the files change between runs
+    nonevents_record=processed_manifest.get('nonevents',ticker_name,interval,filtered=False)
+    with stage('load_nonevents',ticker=ticker_name,interval=interval) as record:
+        if nonevents_record is not None:
+           print(nonevents_record['name'])
+           df=FrameStore.load(processed_manifest.get_path(nonevents_record)) # Parquet, Feather or csv
+        record['rows']=len(df)
 
     # Store probability, graph and probability matrix for all the three versions
     if version=='NA':
@@ -25,7 +29,8 @@ def GetMatrix(target_bps,target_hrs,interval,ticker_name,version='NA'):
     my_matrix=ProbabilityMatrix(df)
     for ver in list(version_dic.keys()):
         print(ver)
-        my_grph=my_matrix.calc_prob(target_bps,target_hrs,ver)
+        with stage('calc_prob',ticker=ticker_name,interval=interval,version=ver,rows=my_matrix.N):
+            my_grph=my_matrix.calc_prob(target_bps,target_hrs,ver)
         version_dic[ver]['<=%']=my_matrix.less_than_equal_percentile
         version_dic[ver]['>%']=my_matrix.greater_than_percentile
         version_dic[ver]['Matrix']=my_matrix.greater_than_prob_matrix
@@ -46,10 +51,14 @@ class ProbabilityMatrix:
       rounded = (np.floor(np_data) + np.round((np_data - np.floor(np_data)) * 2) / 2) #for quartile->4
       return rounded
 
-    def _plot_prob(self,bps_df,percentile,percentiles,target_bps,target_hrs,version):
+    def _plot_prob(self,bps_df,percentile,percentiles,target_bps,target_hrs,version,bw_method='scott'):
       # Plot the histogram
       plt.figure(figsize=(10, 6))
-      sns.kdeplot(bps_df['bps'], color='blue', fill=True, cumulative=True) #Now shows cumulative probability i.e cdf
+      kde = binned_kde(bps_df['bps'], bw_method=bw_method) # Binned KDE: cost bounded by the grid, not the number of movements
+      if kde is not None:
+        grid, _, cdf = kde
+        plt.plot(grid, cdf, color='blue') #Now shows cumulative probability i.e cdf
+        plt.fill_between(grid, cdf, color='blue', alpha=0.25)
 
       # Add title and labels
       plt.title(f'Probability Distribution for BPS ({version}): {target_bps} bps in {target_hrs} hrs')
@@ -123,7 +132,7 @@ class ProbabilityMatrix:
       # Show/return the plot
       return plt
 
-    def calc_prob(self,target_bps,target_hrs,version):
+    def calc_prob(self,target_bps,target_hrs,version,bw_method='scott'):
       if version not in ['Absolute','Up','Down']:
         raise ValueError("Invalid version. Use 'Down', 'Absolute', or 'Up'.")
 
@@ -160,7 +169,7 @@ class ProbabilityMatrix:
       self.less_than_equal_percentile=percentile
       self.greater_than_percentile=100-percentile
       self.greater_than_prob_matrix = prob_matrix
-      return self._plot_prob(bps_df,percentile,percentiles,target_bps,target_hrs,version)
+      return self._plot_prob(bps_df,percentile,percentiles,target_bps,target_hrs,version,bw_method)
 
 
 
@@ -205,4 +214,6 @@ if __name__=='__main__':
    target_hrs=24
    interval='1h'
    ticker_name='ZN'
+   report = RunReport('probability_matrix').start() # Timings appended to logs/run_report.jsonl
    GetMatrix(target_bps,target_hrs,interval,ticker_name)
+   report.finish()
@@ -0,0 +1,322 @@
+import numpy as np
+import pandas as pd
+from moments import MomentAccumulator
+
+# Describe percentiles of the return stats tables
+DESCRIBE_PERCENTILES = [0.05, 0.25, 0.5, 0.68, 0.90, 0.95, 0.99, 0.997]
+
+
+def _describe_index(percentiles):
+    return ["count", "mean", "std", "min"] + [f"{p * 100:g}%" for p in percentiles] + ["max"]
+
+
+class PercentileIndex:
+    """
+    Sorted float64 array of a return series (eg of one ticker, interval, session and
+    return type) that answers rank, percentile and z-score queries in O(log n).
+
+    Built once with one sort; new values are inserted at their sorted position,
+    eg the days settled since the index was stored. Percentiles match scipy percentileofscore(kind="rank") and z-scores use the
+    sample std like pandas.
+    """
+    def __init__(self, values=()):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        self.sorted_values = np.sort(values)
+        self.moments = MomentAccumulator.from_values(values)
+
+    def __str__(self):
+        return f'PercentileIndex of {len(self.sorted_values)} values'
+
+    def __len__(self):
+        return len(self.sorted_values)
+
+    def insert(self, values):
+        """
+        Inserts new values in place, eg the returns of the new days. NaN values are ignored.
+        """
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = np.sort(values[~np.isnan(values)])
+        positions = np.searchsorted(self.sorted_values, values, side="right")
+        self.sorted_values = np.insert(self.sorted_values, positions, values)
+        self.moments.update(values)
+        return self
+
+    def merge(self, other):
+        """
+        Combines two indexes into the index of all their values.
+
+        Returns:
+            PercentileIndex: New index, the two indexes are left unchanged.
+        """
+        merged = PercentileIndex()
+        positions = np.searchsorted(self.sorted_values, other.sorted_values, side="right")
+        merged.sorted_values = np.insert(self.sorted_values, positions, other.sorted_values)
+        merged.moments = self.moments.merge(other.moments)
+        return merged
+
+    def to_dict(self):
+        """
+        State of the index as json types, eg to keep the index of the settled days between runs.
+        """
+        return {"sorted_values": self.sorted_values.tolist(), "moments": self.moments.to_list()}
+
+    @classmethod
+    def from_dict(cls, state):
+        index = cls()
+        index.sorted_values = np.asarray(state["sorted_values"], dtype=np.float64)
+        index.moments = MomentAccumulator.from_list(state["moments"])
+        return index
+
+    def rank(self, value):
+        """
+        Returns:
+            tuple: Number of values below value and number of values below or equal to it.
+        """
+        below = np.searchsorted(self.sorted_values, value, side="left")
+        below_or_equal = np.searchsorted(self.sorted_values, value, side="right")
+        return (int(below), int(below_or_equal))
+
+    def percentile(self, value):
+        """
+        Percentile of value like percentileofscore(kind="rank"): the mean of the
+        strict and weak percentiles, counting a tie as one rank above the values below.
+        """
+        n = len(self.sorted_values)
+        if n == 0:
+            return np.nan
+        below, below_or_equal = self.rank(value)
+        return (below + below_or_equal + (below < below_or_equal)) * (50.0 / n)
+
+    def zscore(self, value):
+        """
+        Z-score of value against the mean and sample std of the indexed values.
+        """
+        return (value - self.moments.mean()) / self.moments.std()
+
+
+class ExactQuantiles:
+    """
+    Quantiles, percentile ranks and describe() of the full series through pandas.
+    This is the default backend of the Returns stats. Percentile ranks are
+    answered by a PercentileIndex of the series, built on first use if not given.
+    """
+    def __init__(self, values, index=None):
+        if isinstance(values, pd.DataFrame):
+            values = values.squeeze(axis=1)
+        self.values = values
+        self.index = index
+
+    def __str__(self):
+        return f'ExactQuantiles of {len(self.values)} values'
+
+    def quantile(self, q):
+        return self.values.quantile(q)
+
+    def median(self):
+        return self.values.median()
+
+    def percentile_of_score(self, score):
+        if self.index is None:
+            self.index = PercentileIndex(self.values)
+        return self.index.percentile(score)
+
+    def zscore(self, score, moments=None):
+        """
+        Z-score of score from the PercentileIndex of the series, built with it.
+        moments is not needed, see KLLSketch.zscore.
+        """
+        if self.index is None:
+            self.index = PercentileIndex(self.values)
+        return self.index.zscore(score)
+
+    def describe(self, percentiles=DESCRIBE_PERCENTILES, moments=None):
+        return self.values.describe(percentiles=percentiles)
+
+
+class KLLSketch:
+    """
+    KLL quantile sketch (Karnin, Lang and Liberty, 2016) of a stream of values.
+
+    Values are kept in a stack of compactors. Level h holds items of weight 2**h;
+    a full compactor sorts its items and promotes every other one, starting at a
+    random offset, to the next level. The memory stays O(k log(n / k)) for n values,
+    values can be added in batches at any time, and sketches of different
+    partitions (dates, sessions or tickers) merge into the sketch of their union.
+
+    Error bound: the rank of a returned quantile is within about 1.7 / k of the
+    requested rank, ie +-0.85% of the values for the default k = 200 (as for the
+    DataSketches KLL sketch, with 99% confidence). Count, min and max are exact.
+    Tail percentiles such as 99.7% are only as good as that rank error, so use
+    the exact backend when the series is short.
+    """
+    def __init__(self, k=200, seed=0):
+        if k < 8:
+            raise ValueError("Invalid k. The KLL sketch needs k >= 8.")
+        self.k = k
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.compactors = [np.empty(0)]
+        self.count = 0
+        self.min = np.nan
+        self.max = np.nan
+
+    def __str__(self):
+        return f'KLLSketch(k={self.k}) of {self.count} values in {self.get_size()} items'
+
+    @classmethod
+    def from_values(cls, values, k=200, seed=0):
+        return cls(k, seed).update(values)
+
+    def get_size(self):
+        return sum(len(items) for items in self.compactors)
+
+    def to_dict(self):
+        """
+        State of the sketch as json types, eg to keep the sketch of the settled days between runs.
+        """
+        return {
+            "k": self.k,
+            "seed": self.seed,
+            "count": self.count,
+            "min": None if np.isnan(self.min) else float(self.min),
+            "max": None if np.isnan(self.max) else float(self.max),
+            "compactors": [items.tolist() for items in self.compactors],
+            # The compactions go on with the random stream where it stopped
+            "rng": self.rng.bit_generator.state,
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        sketch = cls(state["k"], state["seed"])
+        sketch.count = state["count"]
+        sketch.min = np.nan if state["min"] is None else state["min"]
+        sketch.max = np.nan if state["max"] is None else state["max"]
+        sketch.compactors = [np.asarray(items, dtype=float) for items in state["compactors"]]
+        sketch.rng.bit_generator.state = state["rng"]
+        return sketch
+
+    def _get_capacity(self, level):
+        # Lower levels get geometrically smaller compactors, the top one holds k items
+        depth = len(self.compactors) - level - 1
+        return max(int(np.ceil(self.k * (2 / 3) ** depth)), 2)
+
+    def _compress(self):
+        level = 0
+        while level < len(self.compactors):
+            items = self.compactors[level]
+            if len(items) < self._get_capacity(level):
+                level += 1
+                continue
+            if level + 1 == len(self.compactors):
+                self.compactors.append(np.empty(0))
+            items = np.sort(items)
+            # An odd item stays at this level so that the total weight is kept
+            kept = items[len(items) - len(items) % 2:]
+            offset = self.rng.integers(2)
+            promoted = items[offset : len(items) - len(items) % 2 : 2]
+            self.compactors[level] = kept
+            self.compactors[level + 1] = np.concatenate([self.compactors[level + 1], promoted])
+            # Capacities of the lower levels shrink when a level is added, so recheck from the bottom
+            level = 0
+
+    def update(self, values):
+        """
+        Adds values to the sketch. NaN values are ignored.
+        """
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+        self.count += len(values)
+        self.min = np.nanmin([self.min, values.min()])
+        self.max = np.nanmax([self.max, values.max()])
+        self.compactors[0] = np.concatenate([self.compactors[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        """
+        Combines two sketches into the sketch of all their values.
+
+        Args:
+            other (KLLSketch): Sketch of the other values.
+
+        Returns:
+            KLLSketch: New sketch with the smaller k of the two.
+        """
+        merged = KLLSketch(min(self.k, other.k), self.seed)
+        levels = max(len(self.compactors), len(other.compactors))
+        merged.compactors = [
+            np.concatenate([sketch.compactors[level] for sketch in (self, other) if level < len(sketch.compactors)])
+            for level in range(levels)
+        ]
+        merged.count = self.count + other.count
+        merged.min = np.nanmin([self.min, other.min])
+        merged.max = np.nanmax([self.max, other.max])
+        merged._compress()
+        return merged
+
+    def _get_weighted_items(self):
+        items = np.concatenate(self.compactors)
+        weights = np.concatenate(
+            [np.full(len(level_items), 2.0**level) for level, level_items in enumerate(self.compactors)]
+        )
+        order = np.argsort(items, kind="stable")
+        return items[order], weights[order]
+
+    def quantile(self, q):
+        """
+        Approximate quantile(s), within the rank error of the class docstring.
+
+        Args:
+            q (float or list): Quantile(s) between 0 and 1.
+
+        Returns:
+            float or np.ndarray: Value(s) at the quantile(s).
+        """
+        if self.count == 0:
+            return np.nan if np.isscalar(q) else np.full(len(q), np.nan)
+        items, weights = self._get_weighted_items()
+        cumulative = np.cumsum(weights)
+        positions = np.searchsorted(cumulative, np.asarray(q) * cumulative[-1], side="left")
+        result = items[np.clip(positions, 0, len(items) - 1)]
+        # The extremes are tracked exactly
+        result = np.where(np.asarray(q) <= 0, self.min, np.where(np.asarray(q) >= 1, self.max, result))
+        return float(result) if np.isscalar(q) else result
+
+    def median(self):
+        return self.quantile(0.5)
+
+    def percentile_of_score(self, score):
+        """
+        Approximate percentile rank of score, like percentileofscore(kind="rank").
+        """
+        if self.count == 0:
+            return np.nan
+        items, weights = self._get_weighted_items()
+        below = weights[items < score].sum()
+        below_or_equal = weights[items <= score].sum()
+        return (below + below_or_equal) / 2 / weights.sum() * 100
+
+    def zscore(self, score, moments=None):
+        """
+        Z-score of score. The sketch keeps no moments, so they are taken from the
+        moment accumulator of the same values.
+        """
+        if moments is None:
+            return np.nan
+        return (score - moments.mean()) / moments.std()
+
+    def describe(self, percentiles=DESCRIBE_PERCENTILES, moments=None):
+        """
+        Same layout as pandas describe(). Mean and std are taken from the moment
+        accumulator of the same values, if given.
+        """
+        mean = moments.mean() if moments is not None else np.nan
+        std = moments.std() if moments is not None else np.nan
+        return pd.Series(
+            [self.count, mean, std, self.min] + list(self.quantile(list(percentiles))) + [self.max],
+            index=_describe_index(percentiles),
+            name="return",
+        )
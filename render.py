@@ -0,0 +1,195 @@
+import os
+import multiprocessing
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import matplotlib
+import matplotlib.pyplot as plt
+import seaborn as sns
+from density import binned_kde
+from manifest import FileManifest
+
+# Output settings of the figures. "preview" is written on every run, "print" only on request.
+RENDER_PROFILES = {
+    "preview": {"dpi": 100, "format": "png", "subfolder": ""},
+    "preview_webp": {"dpi": 100, "format": "webp", "subfolder": ""},
+    "print": {"dpi": 300, "format": "png", "subfolder": "print"},
+}
+
+
+def plot_distribution(session_returns, bw_method="scott"):
+    """
+    Draws the density histogram of the returns with the KDE overlay and density line.
+    The KDE is estimated once and the same curve is used for both lines.
+    """
+    sns.histplot(
+        session_returns, stat="density", linewidth=0, color="skyblue"
+    )
+    kde = binned_kde(session_returns, bw_method=bw_method)
+    if kde is None:
+        return
+    grid, density, _ = kde
+    within_data = (grid >= np.nanmin(session_returns)) & (grid <= np.nanmax(session_returns))
+    plt.plot(grid[within_data], density[within_data], color="skyblue")
+    plt.plot(grid, density, color="darkblue", linewidth=2)
+
+
+def render_distribution_plot(plot_spec):
+    """
+    Draws and saves one distribution figure from precomputed plot data.
+
+    Args:
+        plot_spec (dict): Output path, titles, dpi and one entry per session panel with
+                          the returns, the latest return annotation and the stats text.
+                          Built by the Returns plotting methods.
+
+    Returns:
+        str: Path of the saved image.
+    """
+    plt.figure(figsize=plot_spec["figsize"])
+    sns.set_style("darkgrid")
+    colors = plot_spec["colors"]
+
+    for i, panel in enumerate(plot_spec["panels"], 1):
+        if plot_spec["use_subplots"]:
+            plt.subplot(3, 2, i)
+
+        plot_distribution(panel["values"], bw_method=plot_spec["bw_method"])
+
+        # Add the latest return as a red point
+        plt.scatter(panel["latest_return"], 0, color="red", s=150, zorder=5)
+        plt.annotate(
+            panel["annotation"],
+            (panel["latest_return"], 0),
+            xytext=(10, 10),  # Offset text slightly more for clarity
+            textcoords="offset points",
+            color="red",
+            fontweight="bold",
+            fontsize=14,  # Increased font size for readability
+        )
+
+        # Add a red dotted vertical line to highlight the latest return
+        plt.axvline(
+            x=panel["latest_return"],
+            color="red",
+            linestyle="--",
+            linewidth=1.5,
+            alpha=0.7,
+            label=panel["vline_label"],
+        )
+        plt.title(panel["title"], fontsize=18)
+        plt.xlabel("Session return in TV bps", fontsize=16)
+        plt.ylabel("Density", fontsize=16)
+        if panel["hide_legend"]:
+            plt.legend("", frameon=False)
+
+        plt.text(
+            0.95,
+            0.95,
+            panel["stats_text"],
+            transform=plt.gca().transAxes,
+            verticalalignment="top",
+            horizontalalignment="right",
+            bbox=dict(
+                boxstyle="round",
+                facecolor=colors["ivory"],
+                edgecolor=colors["dark_slate_gray"],
+                alpha=0.8,
+            ),
+            color=colors["dark_slate_gray"],
+            fontsize=20,
+        )
+
+    plt.tight_layout()
+    plt.suptitle(
+        plot_spec["suptitle"],
+        fontsize=20,
+        y=1.02,
+        x=0.01,
+        ha='left'
+    )
+    plt.savefig(
+        plot_spec["path"],
+        dpi=plot_spec["dpi"],
+        bbox_inches="tight",
+    )
+    plt.close()
+    return plot_spec["path"]
+
+
+def get_profile_spec(plot_spec, profile):
+    """
+    Adapts a plot spec to a render profile: sets the dpi and moves the output
+    path to the profile's subfolder and image format.
+
+    Args:
+        plot_spec (dict): Plot spec with the full resolution output path.
+        profile (str): Name of the profile in RENDER_PROFILES.
+
+    Returns:
+        dict: Copy of the plot spec for the profile.
+    """
+    if profile not in RENDER_PROFILES:
+        raise ValueError(f"Invalid render profile. Use one of {list(RENDER_PROFILES.keys())}.")
+    settings = RENDER_PROFILES[profile]
+    folder, file_name = os.path.split(plot_spec["path"])
+    folder = os.path.join(folder, settings["subfolder"])
+    os.makedirs(folder, exist_ok=True)
+
+    profile_spec = dict(plot_spec)
+    profile_spec["path"] = os.path.join(folder, f'{os.path.splitext(file_name)[0]}.{settings["format"]}')
+    profile_spec["dpi"] = settings["dpi"]
+    return profile_spec
+
+
+def _init_render_worker():
+    # Workers never open windows; Agg renders straight to file
+    matplotlib.use("Agg")
+
+
+class RenderPool:
+    """
+    Renders the distribution figures in a pool of processes, one figure per task.
+    The statistics are computed in the parent process and only the plot data is sent.
+    """
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_render_worker,
+        )
+        self.futures = []
+
+    def __str__(self):
+        return f'RenderPool with {self.max_workers} workers and {len(self.futures)} submitted figures'
+
+    def submit(self, plot_spec, manifest_folder=None):
+        """
+        Queues a figure. If manifest_folder is given, the saved figure is recorded in its manifest by wait().
+        """
+        self.futures.append(
+            (plot_spec["path"], manifest_folder, self.executor.submit(render_distribution_plot, plot_spec))
+        )
+
+    def wait(self):
+        """
+        Waits for all the submitted figures, records the saved ones in their manifests
+        and shuts the pool down. Manifests are only written from this process.
+
+        Returns:
+            dict: Path of every figure that failed mapped to its traceback.
+        """
+        failures = {}
+        for path, manifest_folder, future in self.futures:
+            try:
+                future.result()
+            except Exception:
+                failures[path] = traceback.format_exc()
+                print(f'Rendering failed for {path}:\n{failures[path]}')
+                continue
+            if manifest_folder is not None:
+                FileManifest.open(manifest_folder).record(path)
+        self.executor.shutdown()
+        self.futures = []
+        return failures
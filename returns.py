@@ -1,14 +1,19 @@
 import os
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 from events import Events
-from scipy.stats import percentileofscore
+from render import render_distribution_plot, get_profile_spec
+from moments import MomentAccumulator
+import kernels
+from manifest import FileManifest
+from quantiles import ExactQuantiles, KLLSketch, PercentileIndex, DESCRIBE_PERCENTILES
 from datetime import datetime
 
 class Returns:
     def __init__(
-        self, output_folder="stats_and_plots_folder", dataframe=pd.DataFrame()
+        self, output_folder="stats_and_plots_folder", dataframe=pd.DataFrame(), session_schema=None,
+        render_pool=None, render_profiles=("preview",), quantile_backend="exact", sketch_k=200,
+        kernel_backend="pandas"
     ):
         self.colors = {
             "deep_black": "#000000",
@@ -19,33 +24,151 @@ class Returns:
             "sage_green": "#8FBC8F",
             "light_gray": "#D3D3D3",
         }
-        self.sessions = [
-            "London 0-7 ET",
-            "US Open 7-10 ET",
-            "US Mid 10-15 ET",
-            "US Close 15-17 ET",
-            "Asia 18-24 ET",
-            "All day",
-        ]
+        # Session name: (start hour, end hour) in ET. Fractional hours allowed, eg 6.5 for 6:30.
+        if session_schema is None:
+            session_schema = {
+                "London 0-7 ET": (0, 7),
+                "US Open 7-10 ET": (7, 10),
+                "US Mid 10-15 ET": (10, 15),
+                "US Close 15-17 ET": (15, 17),
+                "Asia 18-24 ET": (18, 24),
+            }
+        self.session_schema = session_schema
+        self.session_labels = list(session_schema.keys()) + ["Other"]
+        self.session_lookup = self._build_session_lookup(session_schema)
+        self.sessions = list(session_schema.keys()) + ["All day"]
         self.output_folder = output_folder
         self.dataframe = dataframe
+        # Results computed from a frame, by (id of the frame, kind), see _get_cached
+        self._frame_cache = {}
+        self.render_pool = render_pool
+        self.render_profiles = render_profiles
+        # "exact" sorts the full series, "sketch" uses KLL sketches with a rank error of about 1.7 / sketch_k
+        if quantile_backend not in ["exact", "sketch"]:
+            raise ValueError("Invalid quantile_backend. Use 'exact' or 'sketch'.")
+        self.quantile_backend = quantile_backend
+        self.sketch_k = sketch_k
+        # "numba" runs the session aggregation in a compiled kernel, if numba is installed
+        self.kernel_backend = kernels.get_kernel_backend(kernel_backend)
         os.makedirs(self.output_folder, exist_ok=True)
 
+    @staticmethod
+    def _build_session_lookup(session_schema):
+        """
+        Maps every minute of the day to the int8 code of its session.
+        Minutes outside all the sessions get the code of "Other".
+        """
+        session_lookup = np.full(24 * 60, len(session_schema), dtype=np.int8)
+        # Fill in reverse so that the first matching session wins on overlaps
+        for code, (start_hour, end_hour) in reversed(list(enumerate(session_schema.values()))):
+            start_minute = int(round(start_hour * 60))
+            end_minute = int(round(end_hour * 60))
+            if start_minute <= end_minute:
+                session_lookup[start_minute:end_minute] = code
+            else:  # Session wraps around midnight
+                session_lookup[start_minute:] = code
+                session_lookup[:end_minute] = code
+        return session_lookup
+
     def get_session(self, timestamp):
-        hour = timestamp.hour
-        # minute = timestamp.minute
-        if 18 <= hour < 24:
-            return "Asia 18-24 ET"
-        elif 0 <= hour < 7:  # or (hour == 6 and minute < 30):
-            return "London 0-7 ET"
-        elif 7 <= hour < 10:  # or (hour == 6 and minute >= 30):
-            return "US Open 7-10 ET"
-        elif 10 <= hour < 15:
-            return "US Mid 10-15 ET"
-        elif 15 <= hour < 17:
-            return "US Close 15-17 ET"
-        else:
+        if pd.isna(timestamp):
             return "Other"
+        minute_of_day = timestamp.hour * 60 + timestamp.minute
+        return self.session_labels[self.session_lookup[minute_of_day]]
+
+    def get_sessions(self, timestamps):
+        """
+        Classifies a whole timestamp column into sessions with the lookup array.
+
+        Args:
+            timestamps (pd.Series): Timestamps in the timezone of the session schema.
+
+        Returns:
+            pd.Series: Categorical session of every timestamp, stored as int8 codes.
+        """
+        timestamps = pd.to_datetime(timestamps)
+        valid = timestamps.notna().to_numpy()
+        codes = np.full(len(timestamps), len(self.session_labels) - 1, dtype=np.int8)
+        minute_of_day = (timestamps.dt.hour * 60 + timestamps.dt.minute)[valid].astype(int)
+        codes[valid] = self.session_lookup[minute_of_day.to_numpy()]
+        return pd.Series(
+            pd.Categorical.from_codes(codes, categories=self.session_labels),
+            index=timestamps.index,
+            name="session",
+        )
+
+    def get_day_keys(self, df):
+        """
+        Integer day keys of the timestamps: days since epoch (int32) and
+        month * 100 + day (int16), both on the wall time of the timestamps.
+        Computed once per frame and cached against its identity.
+
+        Args:
+            df (pd.DataFrame): Data with a timestamp column.
+
+        Returns:
+            dict: "day" and "month_day" arrays, and "valid" mask of the non-null timestamps.
+        """
+        day_keys = self._get_cached(df, "day_keys")
+        if day_keys is not None:
+            return day_keys
+
+        timestamps = pd.to_datetime(df["timestamp"])
+        if timestamps.dt.tz is not None:
+            timestamps = timestamps.dt.tz_localize(None)
+        days = timestamps.to_numpy().astype("datetime64[D]")
+        valid = ~np.isnat(days)
+        day = np.where(valid, days.astype("int64"), 0).astype(np.int32)
+
+        # Month and day of the month from the days since epoch
+        months = days.astype("datetime64[M]")
+        month_of_year = months.astype("int64") % 12 + 1
+        day_of_month = (days - months).astype("int64") + 1
+        month_day = np.where(valid, month_of_year * 100 + day_of_month, 0).astype(np.int16)
+
+        day_keys = {"day": day, "month_day": month_day, "valid": valid}
+        self._set_cached(df, "day_keys", day_keys)
+        return day_keys
+
+    @staticmethod
+    def _to_day_key(date_value):
+        return np.datetime64(pd.to_datetime(date_value).date(), "D").astype("int64")
+
+    def get_date_mask(self, df, start_date="", end_date="", month_day_filter=[]):
+        """
+        Boolean mask of the rows within the date range or the month-day window.
+        Uses the cached day keys, so many windows can be checked over the same frame
+        without copying it.
+
+        Args:
+            df (pd.DataFrame): Data with a timestamp column.
+            start_date (str, optional): First date to keep. Default is no lower limit.
+            end_date (str, optional): Last date to keep. Default is no upper limit.
+            month_day_filter (list, optional): [month, first day, last day]. Overrides the date range.
+
+        Returns:
+            np.ndarray: True for the rows to keep.
+        """
+        day_keys = self.get_day_keys(df)
+        if month_day_filter == []:
+            if start_date == end_date == "":
+                return np.ones(len(df), dtype=bool)
+            mask = day_keys["valid"].copy()
+            if start_date != "":
+                mask &= day_keys["day"] >= self._to_day_key(start_date)
+            if end_date != "":
+                mask &= day_keys["day"] <= self._to_day_key(end_date)
+            return mask
+
+        month = month_day_filter[0]
+        day1 = month_day_filter[1]
+        day2 = month_day_filter[2]
+        month_day = day_keys["month_day"]
+        return (
+            day_keys["valid"]
+            & (month_day >= month * 100 + day1)
+            & (month_day <= month * 100 + day2)
+        )
 
     def filter_date(
         self,
@@ -56,36 +179,13 @@ class Returns:
         to_sessions=True,
     ):
         self.month_day_filter=month_day_filter
-        df = filter_df.copy()
-        if to_sessions == True:
-            df["session"] = df["timestamp"].apply(self.get_session)
 
-        if month_day_filter == []:
-            if start_date == end_date == "":
-                finaldf = df
-            elif start_date == "" and end_date != "":
-                end_date = pd.to_datetime(end_date).date()
-                finaldf = df[(df["timestamp"].dt.date <= end_date)]
-            elif start_date != "" and end_date == "":
-                start_date = pd.to_datetime(start_date).date()
-                finaldf = df[(df["timestamp"].dt.date >= start_date)]
-            else:
-                start_date = pd.to_datetime(start_date).date()
-                end_date = pd.to_datetime(end_date).date()
-                finaldf = df[
-                    (df["timestamp"].dt.date >= start_date)
-                    & (df["timestamp"].dt.date <= end_date)
-                ]
+        # Only the rows that pass the filter are copied
+        mask = self.get_date_mask(filter_df, start_date, end_date, month_day_filter)
+        finaldf = filter_df.take(np.flatnonzero(mask))
+        if to_sessions == True:
+            finaldf["session"] = self.get_sessions(finaldf["timestamp"])
 
-        else:
-            month = month_day_filter[0]
-            day1 = month_day_filter[1]
-            day2 = month_day_filter[2]
-            finaldf = df[
-                (df["timestamp"].dt.month == month)
-                & (df["timestamp"].dt.day >= day1)
-                & (df["timestamp"].dt.day <= day2)
-            ]
         finaldf["year"] = (finaldf["timestamp"].dt.year).astype("Int64")
         finaldf = finaldf.sort_values("timestamp")
         
@@ -104,46 +204,459 @@ class Returns:
         stats_csv.index.name = 'Volatility of Returns Statistic'
         return stats_csv
 
-    # Close Price when the session ended - Open Price when the session started
-    def _calculate_return_bps(self, group):
-        return abs(group["Close"].iloc[-1]-group["Open"].iloc[0]) * 16
+    def _get_cached(self, df, kind):
+        """
+        Result of the given kind (eg "moments") cached for df, or None.
+        """
+        cached = self._frame_cache.get((id(df), kind))
+        if cached is not None and cached[0] is df:
+            return cached[1]
+        return None
 
-    def get_daily_session_returns(self, df):
-        returns = (
-            df.groupby([df["timestamp"].dt.date, "session"], group_keys=False)
-            .apply(self._calculate_return_bps, include_groups=False)
+    def _set_cached(self, df, kind, value):
+        # Hold a reference to df so that its id is not reused while cached
+        self._frame_cache[(id(df), kind)] = (df, value)
+
+    def clear_aggregate_cache(self):
+        """
+        Drops the cached aggregates, moments, sketches, percentile indexes and day keys. Call it once the frames
+        being plotted are modified in place or no longer needed.
+        """
+        self._frame_cache = {}
+
+    def get_session_aggregates(self, df, by_session=True):
+        """
+        Aggregates the bars of every day (and session) in one grouped pass.
+        The result is cached against the identity of df, so repeated calls
+        for the same frame only slice the cached table. Do not modify it in place.
+
+        Args:
+            df (pd.DataFrame): Bars sorted by timestamp with Open, High, Low, Close columns.
+            by_session (bool, optional): Group by date and session if True, else by date only.
+
+        Returns:
+            pd.DataFrame: First Open, last Close, max High, min Low and bar count of every group,
+                          along with the ABS(Close - Open) return and the (High - Low) volatility return.
+        """
+        cache_kind = "session_aggregates" if by_session else "day_aggregates"
+        cached_aggregates = self._get_cached(df, cache_kind)
+        if cached_aggregates is not None:
+            return cached_aggregates
+
+        if self.kernel_backend == "numba":
+            aggregates = self._aggregate_bars_numba(df, by_session)
+        else:
+            keys = [df["timestamp"].dt.date.rename("date")]
+            if by_session:
+                keys.append("session")
+            aggregates = self._aggregate_bars(df, keys)
+
+        self._set_cached(df, cache_kind, aggregates)
+        return aggregates
+
+    def _get_all_day_and_session_table(self, df):
+        """
+        Aggregates of every session followed by the ones of the whole day under the
+        session "All day", in one table with an object session column. Only the whole
+        day if df has no session column. Cached against the identity of df.
+        """
+        table = self._get_cached(df, "all_day_and_session_table")
+        if table is not None:
+            return table
+        table = self.get_session_aggregates(df, by_session=False).assign(session="All day")
+        if "session" in df.columns:
+            table = pd.concat(
+                [self.get_session_aggregates(df, by_session=True).astype({"session": object}), table],
+                ignore_index=True,
+            )
+        self._set_cached(df, "all_day_and_session_table", table)
+        return table
+
+    @staticmethod
+    def _aggregate_bars(df, keys):
+        """
+        First Open, last Close, max High, min Low, bar count and returns of the groups
+        of df by keys. df has to be sorted by timestamp within every group.
+        """
+        # Row positions give the first Open and last Close exactly like iloc[0] and iloc[-1]
+        aggregates = (
+            df.assign(row=np.arange(len(df)))
+            .groupby(keys, observed=True)
+            .agg(
+                first_row=("row", "min"),
+                last_row=("row", "max"),
+                high=("High", "max"),
+                low=("Low", "min"),
+                bars=("row", "size"),
+            )
             .reset_index()
         )
-        returns.columns = ["date", "session", "return"]
+        aggregates.insert(
+            len(keys), "open", df["Open"].to_numpy()[aggregates["first_row"].to_numpy()]
+        )
+        aggregates.insert(
+            len(keys) + 1, "close", df["Close"].to_numpy()[aggregates["last_row"].to_numpy()]
+        )
+        aggregates.drop(["first_row", "last_row"], axis=1, inplace=True)
+
+        # Close Price when the session ended - Open Price when the session started
+        aggregates["return"] = (aggregates["close"] - aggregates["open"]).abs() * 16
+        aggregates["volatility_return"] = 16 * (aggregates["high"] - aggregates["low"])
+        return aggregates
+
+    def _aggregate_bars_numba(self, df, by_session):
+        """
+        Same table as _aggregate_bars grouped by date (and session), from one compiled
+        pass over the int64 group keys and float64 prices instead of a pandas groupby.
+        """
+        day_keys = self.get_day_keys(df)
+        group_keys = day_keys["day"].astype(np.int64)
+        valid = day_keys["valid"].copy()
+        n_codes = 1
+        if by_session:
+            sessions = df["session"]
+            if not isinstance(sessions.dtype, pd.CategoricalDtype):
+                sessions = sessions.astype("category")
+            session_codes = sessions.cat.codes.to_numpy().astype(np.int64)
+            n_codes = len(sessions.cat.categories)
+            group_keys = group_keys * n_codes + session_codes
+            valid &= session_codes >= 0
+
+        # Sorted unique keys give the groups in the order of groupby
+        unique_keys, valid_group_ids = np.unique(group_keys[valid], return_inverse=True)
+        group_ids = np.full(len(df), -1, dtype=np.int64)
+        group_ids[valid] = valid_group_ids
+        first_row, last_row, high, low, bars = kernels.aggregate_groups(
+            group_ids, len(unique_keys), df["High"].to_numpy(), df["Low"].to_numpy()
+        )
+
+        aggregates = pd.DataFrame(
+            {"date": pd.to_datetime(np.floor_divide(unique_keys, n_codes), unit="D").date}
+        )
+        if by_session:
+            session_values = pd.Categorical.from_codes(unique_keys % n_codes, dtype=sessions.dtype)
+            if not isinstance(df["session"].dtype, pd.CategoricalDtype):
+                session_values = np.asarray(session_values)
+            aggregates["session"] = session_values
+        aggregates["open"] = df["Open"].to_numpy()[first_row]
+        aggregates["close"] = df["Close"].to_numpy()[last_row]
+        aggregates["high"] = high
+        aggregates["low"] = low
+        aggregates["bars"] = bars
+
+        # Close Price when the session ended - Open Price when the session started
+        aggregates["return"] = (aggregates["close"] - aggregates["open"]).abs() * 16
+        aggregates["volatility_return"] = 16 * (aggregates["high"] - aggregates["low"])
+        return aggregates
+
+    def get_daily_session_returns(self, df):
+        returns = self.get_session_aggregates(df, by_session=True)
+        returns = returns[["date", "session", "return"]]
         return returns
 
     def get_daily_returns(self, df):
-        daily_returns_all = (
-            df.groupby(df["timestamp"].dt.date)
-            .apply(self._calculate_return_bps)
-            .reset_index()
-        )
-        daily_returns_all.columns = ["date", "return"]
+        daily_returns_all = self.get_session_aggregates(df, by_session=False)
+        daily_returns_all = daily_returns_all[["date", "return"]]
         return daily_returns_all
 
-    def plot_daily_session_returns(self, filtered_df, tickersymbol_val, interval_val):
+    def update_session_store(self, session_store, df, tickersymbol_val, interval_val, rebuild=False):
+        """
+        Brings the stored aggregates of (ticker, interval) up to date with df and serves
+        them to the plotting methods, instead of aggregating the full history of df again.
+
+        Only the days on or after the last stored date are aggregated (the last stored day
+        may have been incomplete) and upserted into the store. The stored days before the
+        first date of df are not served, so the plots cover the same days as df. The moment
+        accumulators and the quantile sketches (or percentile indexes with the "exact" backend)
+        of the days that can no longer change are kept in the store and only updated with the
+        new days.
+
+        Args:
+            session_store (SessionReturnStore): Store of the aggregates.
+            df (pd.DataFrame): Bars sorted by timestamp with a session column, as passed to the plotting methods.
+            tickersymbol_val (str): Ticker symbol, eg 'ZN'.
+            interval_val (str): Interval of the bars, eg '1h'.
+            rebuild (bool, optional): Aggregate the full history of df again, eg after the
+                                      events file changed. Default is False.
+
+        Returns:
+            pd.DataFrame: Aggregates served for df, with the whole day under the session "All day".
+        """
+        if rebuild:
+            session_store.clear(tickersymbol_val, interval_val)
+        last_date = session_store.get_last_date(tickersymbol_val, interval_val)
+        if last_date is None:
+            new_df = df
+        else:
+            new_df = df.take(np.flatnonzero(self.get_date_mask(df, start_date=str(last_date))))
+        print(f'{session_store}: aggregating {len(new_df)} of {len(df)} bars of {tickersymbol_val} {interval_val}')
+
+        new_aggregates = self._get_all_day_and_session_table(new_df)[
+            self.get_session_aggregates(new_df, by_session=True).columns
+        ]
+        stored = session_store.upsert(tickersymbol_val, interval_val, new_aggregates)
+        session_store.save_key(tickersymbol_val, interval_val)
+
+        day_keys = self.get_day_keys(df)
+        if day_keys["valid"].any():
+            first_date = pd.Timestamp(day_keys["day"][day_keys["valid"]].min(), unit="D").date()
+            stored = stored[stored["date"] >= first_date]
+        self._update_stored_moments(session_store, stored, tickersymbol_val, interval_val, df)
+        self._update_stored_quantiles(session_store, stored, tickersymbol_val, interval_val, df)
+
+        # Seed the cache of df with the stored tables in the layout of get_session_aggregates
+        all_day = stored["session"] == "All day"
+        by_session = stored[~all_day].reset_index(drop=True)
+        by_session["session"] = pd.Categorical(by_session["session"], categories=self.session_labels)
+        self._set_cached(df, "session_aggregates", by_session)
+        self._set_cached(df, "day_aggregates", stored[all_day].drop(columns="session").reset_index(drop=True))
+        return stored
+
+    @staticmethod
+    def _get_moments_of_table(table):
+        """
+        Moment accumulators of the return columns of an aggregates table, per session.
+        """
+        sessions = table["session"].astype(object)
+        return {
+            column: MomentAccumulator.from_groups(table[column], sessions)
+            for column in ["return", "volatility_return"]
+        }
+
+    @staticmethod
+    def _merge_moments(moments, other_moments):
+        merged = {}
+        for column in set(moments) | set(other_moments):
+            sessions = dict(moments.get(column, {}))
+            for session, accumulator in other_moments.get(column, {}).items():
+                sessions[session] = sessions.get(session, MomentAccumulator()).merge(accumulator)
+            merged[column] = sessions
+        return merged
+
+    def get_session_moments(self, df):
+        """
+        Moment accumulators (count, mean, M2, M3, M4) of the return and volatility return
+        of every session, and of the whole day under "All day". Cached against the identity of df.
+
+        Args:
+            df (pd.DataFrame): Bars as passed to the plotting methods.
+
+        Returns:
+            dict: {"return": {session: MomentAccumulator}, "volatility_return": {...}}.
+        """
+        moments = self._get_cached(df, "moments")
+        if moments is None:
+            moments = self._get_moments_of_table(self._get_all_day_and_session_table(df))
+            self._set_cached(df, "moments", moments)
+        return moments
+
+    def get_session_sketches(self, df):
+        """
+        KLL quantile sketches of the return and volatility return of every session, and of
+        the whole day under "All day". Cached against the identity of df.
+
+        Args:
+            df (pd.DataFrame): Bars as passed to the plotting methods.
+
+        Returns:
+            dict: {"return": {session: KLLSketch}, "volatility_return": {...}}.
+        """
+        sketches = self._get_cached(df, "sketches")
+        if sketches is not None:
+            return sketches
+
+        table = self._get_all_day_and_session_table(df)
+        sketches = {
+            column: {
+                session: KLLSketch.from_values(values, k=self.sketch_k)
+                for session, values in table.groupby("session", sort=False)[column]
+            }
+            for column in ["return", "volatility_return"]
+        }
+        self._set_cached(df, "sketches", sketches)
+        return sketches
+
+    def get_percentile_indexes(self, df):
+        """
+        Percentile indexes of the return and volatility return of every session, and of
+        the whole day under "All day". Cached against the identity of df, so that every
+        rank, percentile or z-score query on the same frame is a binary search.
+
+        Args:
+            df (pd.DataFrame): Bars as passed to the plotting methods.
+
+        Returns:
+            dict: {"return": {session: PercentileIndex}, "volatility_return": {...}}.
+        """
+        indexes = self._get_cached(df, "percentile_indexes")
+        if indexes is not None:
+            return indexes
+
+        table = self._get_all_day_and_session_table(df)
+        indexes = {
+            column: {
+                session: PercentileIndex(values)
+                for session, values in table.groupby("session", sort=False)[column]
+            }
+            for column in ["return", "volatility_return"]
+        }
+        self._set_cached(df, "percentile_indexes", indexes)
+        return indexes
+
+    def get_quantiles(self, df, column, session, session_returns):
+        """
+        Quantile backend of the stats of a session: the exact series, or its sketch.
+
+        Args:
+            df (pd.DataFrame): Bars as passed to the plotting methods.
+            column (str): "return" or "volatility_return".
+            session (str): Session name or "All day".
+            session_returns (pd.Series): Returns of the session, used by the exact backend.
+
+        Returns:
+            ExactQuantiles or KLLSketch: Object with quantile, median, percentile_of_score, zscore and describe.
+        """
+        if self.quantile_backend == "sketch":
+            return self.get_session_sketches(df)[column][session]
+        return ExactQuantiles(session_returns, index=self.get_percentile_indexes(df)[column][session])
+
+    def _update_stored_moments(self, session_store, stored, tickersymbol_val, interval_val, df):
+        """
+        Adds the days settled since the last run to the stored moment accumulators and
+        seeds the moments of df with them, merged with the days that may still change.
+        """
+        if stored.empty:
+            return
+        first_date = stored["date"].min()
+        last_date = stored["date"].max()
+
+        state = session_store.load_moments(tickersymbol_val, interval_val)
+        if (
+            state is None or state["key"] != session_store.key
+            or state["first_date"] != first_date or state["settled_date"] > last_date
+        ):
+            # Nothing usable is stored, eg the moments were saved with other events,
+            # accumulate all the settled days again
+            settled_date = first_date
+            moments = {}
+        else:
+            settled_date = state["settled_date"]
+            moments = state["moments"]
+
+        # The last stored day may be incomplete, so it is only settled on a later run
+        new_days = stored[(stored["date"] >= settled_date) & (stored["date"] < last_date)]
+        moments = self._merge_moments(moments, self._get_moments_of_table(new_days))
+        session_store.save_moments(tickersymbol_val, interval_val, first_date, last_date, moments)
+
+        open_days = stored[stored["date"] >= last_date]
+        self._set_cached(df, "moments", self._merge_moments(moments, self._get_moments_of_table(open_days)))
+
+    def _update_stored_quantiles(self, session_store, stored, tickersymbol_val, interval_val, df):
+        """
+        Adds the days settled since the last run to the stored quantile structures of the
+        backend (KLL sketches, or percentile indexes for the exact backend) and seeds the
+        ones of df with them, merged with the days that may still change. Same settled and
+        open days as _update_stored_moments.
+        """
+        if stored.empty:
+            return
+        first_date = stored["date"].min()
+        last_date = stored["date"].max()
+
+        if self.quantile_backend == "sketch":
+            kind, field = "sketches", "sketches"
+            load, save = session_store.load_sketches, session_store.save_sketches
+            build = lambda values: KLLSketch.from_values(values, k=self.sketch_k)
+            add = lambda sketch, values: sketch.update(values)
+            is_usable = lambda sketch: sketch.k == self.sketch_k
+        else:
+            kind, field = "percentile_indexes", "indexes"
+            load, save = session_store.load_indexes, session_store.save_indexes
+            build = PercentileIndex
+            add = lambda index, values: index.insert(values)
+            is_usable = lambda index: True
+
+        state = load(tickersymbol_val, interval_val)
+        if (
+            state is None or state["key"] != session_store.key
+            or state["first_date"] != first_date or state["settled_date"] > last_date
+            or not all(
+                is_usable(summary)
+                for sessions in state[field].values()
+                for summary in sessions.values()
+            )
+        ):
+            # Nothing usable is stored, summarise all the settled days again
+            settled_date = first_date
+            summaries = {}
+        else:
+            settled_date = state["settled_date"]
+            summaries = state[field]
+
+        # The settled summaries are updated in place with the values of the newly settled days
+        new_days = stored[(stored["date"] >= settled_date) & (stored["date"] < last_date)]
+        open_days = stored[stored["date"] >= last_date]
+        served = {}
+        for column in ["return", "volatility_return"]:
+            column_summaries = summaries.setdefault(column, {})
+            for session, values in new_days.groupby(new_days["session"].astype(object), sort=False)[column]:
+                if session in column_summaries:
+                    add(column_summaries[session], values)
+                else:
+                    column_summaries[session] = build(values)
+            served[column] = dict(column_summaries)
+            for session, values in open_days.groupby(open_days["session"].astype(object), sort=False)[column]:
+                open_summary = build(values)
+                if session in served[column]:
+                    open_summary = served[column][session].merge(open_summary)
+                served[column][session] = open_summary
+        save(tickersymbol_val, interval_val, first_date, last_date, summaries)
+
+        self._set_cached(df, kind, served)
+
+    def _render(self, plot_spec, render_profiles=None):
+        """
+        Renders the figure once per render profile, in the render pool if one is set,
+        else in this process.
+        """
+        if render_profiles is None:
+            render_profiles = self.render_profiles
+        for profile in render_profiles:
+            profile_spec = get_profile_spec(plot_spec, profile)
+            if self.render_pool is not None:
+                # The pool records the figure in the manifest once it is saved
+                self.render_pool.submit(profile_spec, manifest_folder=self.output_folder)
+            else:
+                render_distribution_plot(profile_spec)
+                FileManifest.open(self.output_folder).record(profile_spec["path"])
+
+    def _save_csv(self, table, file_name, **kwargs):
+        """
+        Saves a table in the output folder and records it in the folder's manifest.
+        """
+        path = os.path.join(self.output_folder, file_name)
+        table.to_csv(path, **kwargs)
+        FileManifest.open(self.output_folder).record(path, rows=len(table))
+        return path
+
+    def plot_daily_session_returns(self, filtered_df, tickersymbol_val, interval_val, bw_method="scott", render_profiles=None):
 
         start_date = (filtered_df["timestamp"].dt.date.tolist())[0]
         end_date = (filtered_df["timestamp"].dt.date.tolist())[-1]
         print(start_date, end_date)
         sessions = self.sessions
 
-        plt.figure(figsize=(24, 18))
-        sns.set_style("darkgrid")
         list_stats = []
+        panels = []
 
         if 'd' in interval_val:
             sessions=['All day']
+        else:
+            # Aggregate once; every session subplot slices the same table
+            daily_session_returns = self.get_daily_session_returns(filtered_df)
 
-        for i, session in enumerate(sessions, 1):
-            plt.subplot(3, 2, i)
+        for session in sessions:
             if session != "All day":
-                daily_session_returns = self.get_daily_session_returns(filtered_df)
                 session_returns = daily_session_returns[
                     daily_session_returns["session"] == session
                 ]["return"]
@@ -159,137 +672,78 @@ class Returns:
                 latest_date = daily_returns_all["date"].iloc[-1]
 
             # Calculate the percentile of the latest return
-            latest_percentile = percentileofscore(
-                session_returns.squeeze(), latest_return, kind="rank"
-            )
-
-            # Calculate descriptive stats
-            mean = session_returns.mean()
-            median = session_returns.median()
-            perc95 = session_returns.quantile(0.95)
-            perc99 = session_returns.quantile(0.99)
-            std = session_returns.std()
-            skew = session_returns.skew()
-            kurt = session_returns.kurtosis()
-            zscore=(session_returns-mean)/std
-            latest_zscore=round(zscore.iloc[-1],2)
-
-            sns.histplot(
-                session_returns, kde=True, stat="density", linewidth=0, color="skyblue"
-            )
-            sns.kdeplot(session_returns, color="darkblue", linewidth=2)
-
-           
-            # Add the latest return as a red point
-            plt.scatter(latest_return, 0, color="red", s=150, zorder=5)
-            plt.annotate(
-                f"({latest_date}, Return:{latest_return:.2f}, Zscore: {latest_zscore}, %ile:{latest_percentile:.1f}%)",
-                (latest_return, 0),
-                xytext=(10, 10),  # Offset text slightly more for clarity
-                textcoords="offset points",
-                color="red",
-                fontweight="bold",
-                fontsize=14,  # Increased font size for readability
-            )
+            quantiles = self.get_quantiles(filtered_df, "return", session, session_returns)
+            latest_percentile = quantiles.percentile_of_score(latest_return)
 
-            # Add a red dotted vertical line to highlight the latest return
-            plt.axvline(
-                x=latest_return,
-                color="red",
-                linestyle="--",
-                linewidth=1.5,
-                alpha=0.7,
-                label="Latest Return",
-            )
-            plt.title(f"{session}", fontsize=18)
-            plt.xlabel("Session return in TV bps", fontsize=16)
-            plt.ylabel("Density", fontsize=16)
+            # Calculate descriptive stats, the moments from the session accumulators
+            moments = self.get_session_moments(filtered_df)["return"][session]
+            mean = moments.mean()
+            median = quantiles.median()
+            perc95 = quantiles.quantile(0.95)
+            perc99 = quantiles.quantile(0.99)
+            std = moments.std()
+            skew = moments.skew()
+            kurt = moments.kurtosis()
+            latest_zscore=round(quantiles.zscore(latest_return, moments=moments),2)
 
-           
             stats_text = f"Mean: {mean:.2f}\nMedian: {median:.2f}\nStd: {std:.1f}\n95%ile: {perc95:.1f}\n99%ile: {perc99:.1f}\nSkew: {skew:.1f}\nKurt: {kurt:.1f}"
-            plt.text(
-                0.95,
-                0.95,
-                stats_text,
-                transform=plt.gca().transAxes,
-                verticalalignment="top",
-                horizontalalignment="right",
-                bbox=dict(
-                    boxstyle="round",
-                    facecolor=self.colors["ivory"],
-                    edgecolor=self.colors["dark_slate_gray"],
-                    alpha=0.8,
-                ),
-                color=self.colors["dark_slate_gray"],
-                fontsize=20,
-            )
+            panels.append({
+                "title": f"{session}",
+                "values": session_returns,
+                "latest_return": latest_return,
+                "annotation": f"({latest_date}, Return:{latest_return:.2f}, Zscore: {latest_zscore}, %ile:{latest_percentile:.1f}%)",
+                "vline_label": "Latest Return",
+                "hide_legend": False,
+                "stats_text": stats_text,
+            })
 
             list_stats.append(
-                session_returns.describe(
-                    percentiles=[0.05, 0.25, 0.5, 0.68, 0.90, 0.95, 0.99, 0.997]
-                )
+                quantiles.describe(percentiles=DESCRIBE_PERCENTILES, moments=moments)
             )
-        plt.tight_layout()
         month_to_name = (lambda a, b, c: f"Dates filtered: {datetime.strptime(str(a), '%m').strftime('%B')}: {b}-{c}")
         if self.month_day_filter==[]:
             filtered_string=""
         else:
             filtered_string = month_to_name(self.month_day_filter[0],self.month_day_filter[1], self.month_day_filter[2])
-        plt.suptitle(
-            f"Distribution of Returns {tickersymbol_val} with interval of {interval_val}: ABS(End - Start) across trading sessions: {start_date} to {end_date}.{filtered_string}",
-            fontsize=20,
-            y=1.02,
-            x=0.01,
-            ha='left'
-        )
-        plt.savefig(
-            os.path.join(
+        self._render({
+            "path": os.path.join(
                 self.output_folder,
                 f"{tickersymbol_val}_{interval_val}_Returns_Distribution.png", #_{start_date}_{end_date}
             ),
-            dpi=300,
-            bbox_inches="tight",
-        )
-        plt.close()
+            "suptitle": f"Distribution of Returns {tickersymbol_val} with interval of {interval_val}: ABS(End - Start) across trading sessions: {start_date} to {end_date}.{filtered_string}",
+            "figsize": (24, 18),
+            "use_subplots": True,
+            "colors": self.colors,
+            "bw_method": bw_method,
+            "panels": panels,
+        }, render_profiles)
 
         df_stats = pd.concat(list_stats, axis=1)
         df_stats.columns = sessions
         df_stats.index.name=f'(Return Stats:- Interval:{interval_val}, Symbol:{tickersymbol_val})'
-        df_stats.to_csv(
-            os.path.join(
-                self.output_folder,
-                f"{tickersymbol_val}_{interval_val}_Returns_stats.csv",
-            )
-        )
+        self._save_csv(df_stats, f"{tickersymbol_val}_{interval_val}_Returns_stats.csv")
         print(df_stats.round(1))
 
     
 
     def get_daily_session_volatility_returns(self, df):
-        
-        session_volatility_df = df.groupby([df["timestamp"].dt.date, "session"]).agg(
-            {"High": ["max"], "Low": ["min"]}
-        )
-        session_volatility_df["return"] = 16 * (
-            session_volatility_df["High"]["max"] - session_volatility_df["Low"]["min"]
-        )
-        session_volatility_df = session_volatility_df.reset_index()
-        session_volatility_df.columns = ["date", "session", "high", "low", "return"]
+        session_volatility_df = self.get_session_aggregates(df, by_session=True)
+        session_volatility_df = session_volatility_df[
+            ["date", "session", "high", "low", "volatility_return"]
+        ].rename(columns={"volatility_return": "return"})
         session_volatility_df = session_volatility_df.sort_values(["date", "session"])
         return session_volatility_df
 
     def get_daily_volatility_returns(self, df):
-        all_df = df.groupby([df["timestamp"].dt.date]).agg(
-            {"High": ["max"], "Low": ["min"]}
+        all_df = self.get_session_aggregates(df, by_session=False)
+        all_df = all_df[["date", "high", "low", "volatility_return"]].rename(
+            columns={"volatility_return": "return"}
         )
-        all_df["return"] = 16 * (all_df["High"]["max"] - all_df["Low"]["min"])
-        all_df = all_df.reset_index()
-        all_df.columns = ["date", "high", "low", "return"]
         all_df = all_df.sort_values(["date"])
         return all_df
 
     def plot_daily_session_volatility_returns(
-        self, filtered_df, tickersymbol_val, interval_val
+        self, filtered_df, tickersymbol_val, interval_val, bw_method="scott", render_profiles=None
     ):
                 
         start_date = (filtered_df["timestamp"].dt.date.tolist())[0]
@@ -297,8 +751,7 @@ class Returns:
         
         # Analyze distributions
         list_stats = []
-        plt.figure(figsize=(24, 18))
-        sns.set_style("darkgrid")
+        panels = []
 
         skip_sessions=False
         if 'd' in interval_val:
@@ -306,12 +759,12 @@ class Returns:
             skip_sessions=True
         else:
             sessions = self.sessions
-            
-
+            # Aggregate once; every session subplot slices the same table
+            session_volatility_df = self.get_daily_session_volatility_returns(
+                filtered_df
+            )
 
-        for i, session in enumerate(sessions, 1):
-            if skip_sessions==False:
-                plt.subplot(3, 2, i)
+        for session in sessions:
             if session == "All day":
                 all_volatility_df = self.get_daily_volatility_returns(filtered_df)
                 session_returns = all_volatility_df["return"]
@@ -326,21 +779,17 @@ class Returns:
                 latest_custom_days_return_stats.name=f'(Session:{session}, Interval:{interval_val}, Symbol:{tickersymbol_val})'
 
                 latest_custom_days_return.rename(columns={'date':'Date','return':f'Volatility of Returns (Session:{session}, Interval:{interval_val}, Symbol:{tickersymbol_val})'},inplace=True)
-                latest_custom_days_return.to_csv(os.path.join(self.output_folder,
-                    f"{"_".join(str(session).split())}_latest_custom_days_Volatility_Returns_{interval_val}_{tickersymbol_val}.csv"),index=False
+                self._save_csv(latest_custom_days_return,
+                    f"{"_".join(str(session).split())}_latest_custom_days_Volatility_Returns_{interval_val}_{tickersymbol_val}.csv",index=False
                 )
-                latest_custom_days_return_stats.to_csv(os.path.join(self.output_folder,
-                    f"{"_".join(str(session).split())}_latest_custom_days_Volatility_Returns_{interval_val}_{tickersymbol_val}_stats.csv")
+                self._save_csv(latest_custom_days_return_stats,
+                    f"{"_".join(str(session).split())}_latest_custom_days_Volatility_Returns_{interval_val}_{tickersymbol_val}_stats.csv"
                 )
                 
                 latest_return = session_returns.iloc[-1]
                 latest_zscore=latest_custom_days_return['ZScore wrt All Days'].iloc[-1]
                 latest_date = all_volatility_df["date"].iloc[-1]
             else:
-                session_volatility_df = self.get_daily_session_volatility_returns(
-                    filtered_df
-                )
-                
                 session_returns = session_volatility_df.loc[
                     session_volatility_df["session"] == session, ["return"]
                 ]
@@ -360,145 +809,216 @@ class Returns:
                 latest_custom_days_return_stats.name=f'(Session:{session}, Interval:{interval_val}, Symbol:{tickersymbol_val})'
                 
                 latest_custom_days_return.rename(columns={'date':'Date','return':f'Volatility of Returns (Session:{session}, Interval:{interval_val}, Symbol:{tickersymbol_val})'},inplace=True)
-                latest_custom_days_return.to_csv(os.path.join(self.output_folder,
-                    f"{"_".join(str(session).split())}_latest_custom_days_Volatility_Returns_{interval_val}_{tickersymbol_val}.csv"),index=False
+                self._save_csv(latest_custom_days_return,
+                    f"{"_".join(str(session).split())}_latest_custom_days_Volatility_Returns_{interval_val}_{tickersymbol_val}.csv",index=False
                 )
 
-                latest_custom_days_return_stats.to_csv(os.path.join(self.output_folder,
-                    f"{"_".join(str(session).split())}_latest_custom_days_Volatility_Returns_{interval_val}_{tickersymbol_val}_stats.csv")
+                self._save_csv(latest_custom_days_return_stats,
+                    f"{"_".join(str(session).split())}_latest_custom_days_Volatility_Returns_{interval_val}_{tickersymbol_val}_stats.csv"
                 )
 
                 latest_zscore=latest_custom_days_return['ZScore wrt All Days'].iloc[-1]
             # Calculate the percentile of the latest return
-            latest_percentile = percentileofscore(
-                session_returns.squeeze(), latest_return, kind="rank"
-            )
+            quantiles = self.get_quantiles(filtered_df, "volatility_return", session, session_returns)
+            latest_percentile = quantiles.percentile_of_score(latest_return)
 
-            # Descriptive Statistics
-            mean = session_returns.mean()
-            median = session_returns.median()
-            std = session_returns.std()
-            perc95 = session_returns.quantile(0.95)
-            perc99 = session_returns.quantile(0.99)
-            skew = session_returns.skew()
-            kurt = session_returns.kurtosis()
+            # Descriptive Statistics, the moments from the session accumulators
+            moments = self.get_session_moments(filtered_df)["volatility_return"][session]
+            mean = moments.mean()
+            median = quantiles.median()
+            std = moments.std()
+            perc95 = quantiles.quantile(0.95)
+            perc99 = quantiles.quantile(0.99)
+            skew = moments.skew()
+            kurt = moments.kurtosis()
 
             # zscore=(session_returns-mean)/std
             latest_zscore=round(latest_zscore,2)
 
-            sns.histplot(
-                session_returns, kde=True,stat="density",linewidth=0, color="skyblue"
-            )
-            sns.kdeplot(session_returns, color="darkblue", linewidth=2)
-            # Add the latest return as a red point
-            plt.scatter(latest_return, 0, color="red", s=150, zorder=5)
-            #plt.scatter(mean,0,color='black',s=150,zorder=5)
-
-            plt.annotate(
-                f"({latest_date}, VoltyReturn:{latest_return:.2f}, Zscore:{latest_zscore}, {latest_percentile:.1f}%ile)",
-                (latest_return, 0),
-                xytext=(10, 10),  # Offset text slightly more for clarity
-                textcoords="offset points",
-                color="red",
-                fontweight="bold",
-                fontsize=14,  # Increased font size for readability
-            )
-            # Add a red dotted vertical line to highlight the latest return
-            plt.axvline(
-                x=latest_return,
-                color="red",
-                linestyle="--",
-                linewidth=1.5,
-                alpha=0.7,
-                label="Latest Volty. Return",
-            )
-
-            # plt.axvline(
-            #     x=mean,
-            #     color="black",
-            #     linestyle="--",
-            #     linewidth=1.5,
-            #     alpha=0.7,
-            #     label="Mean Volty. Return",
-            # )
-            
-
-            plt.title(f"{session}", fontsize=18)
-            plt.xlabel("Session return in TV bps", fontsize=16)
-            plt.ylabel("Density", fontsize=16)
-            plt.legend("", frameon=False)
-
-            
-
-
-            if isinstance(session_returns, pd.DataFrame):
-                mean, median, std, perc95, perc99, skew, kurt = [
-                    x.iloc[0] for x in [mean, median, std, perc95, perc99, skew, kurt]
-                ]
-
             list_stats.append(
-                session_returns.describe(
-                    percentiles=[0.05, 0.25, 0.5, 0.68, 0.90, 0.95, 0.99, 0.997]
-                )
+                quantiles.describe(percentiles=DESCRIBE_PERCENTILES, moments=moments)
             )
 
             stats_text = f"Mean: {mean:.2f}\nMedian: {median:.2f}\nStd: {std:.1f}\n95%ile: {perc95:.1f}\n99%ile: {perc99:.1f}\nSkew: {skew:.1f}\nKurt: {kurt:.1f}\n"
-            plt.text(
-                0.95,
-                0.95,
-                stats_text,
-                transform=plt.gca().transAxes,
-                verticalalignment="top",
-                horizontalalignment="right",
-                bbox=dict(
-                    boxstyle="round",
-                    facecolor=self.colors["ivory"],
-                    edgecolor=self.colors["dark_slate_gray"],
-                    alpha=0.8,
-                ),
-                color=self.colors["dark_slate_gray"],
-                fontsize=20,
-            )
+            panels.append({
+                "title": f"{session}",
+                "values": session_returns,
+                "latest_return": latest_return,
+                "annotation": f"({latest_date}, VoltyReturn:{latest_return:.2f}, Zscore:{latest_zscore}, {latest_percentile:.1f}%ile)",
+                "vline_label": "Latest Volty. Return",
+                "hide_legend": True,
+                "stats_text": stats_text,
+            })
 
-        
-        plt.tight_layout()
         month_to_name = lambda a, b, c: f"Dates filtered: {datetime.strptime(str(a), '%m').strftime('%B')}: {b}-{c}"
         if self.month_day_filter==[]:
             filtered_string=""
         else:
             filtered_string = month_to_name(self.month_day_filter[0],self.month_day_filter[1], self.month_day_filter[2])
-        plt.suptitle(
-            f"Distribution of Volatility {tickersymbol_val} with interval of {interval_val}: (High - Low) across trading sessions: {start_date} to {end_date}.{filtered_string}",
-            fontsize=20,
-            y=1.02,
-            x=0.01,
-            ha='left'
-        )
-
-        
-        plt.savefig(
-            os.path.join(
+        self._render({
+            "path": os.path.join(
                 self.output_folder,
                 f"{tickersymbol_val}_{interval_val}_Volatility_Distribution.png",
             ),
-            dpi=300,
-            bbox_inches="tight",
-        )
-        plt.close()
+            "suptitle": f"Distribution of Volatility {tickersymbol_val} with interval of {interval_val}: (High - Low) across trading sessions: {start_date} to {end_date}.{filtered_string}",
+            "figsize": (24, 18),
+            "use_subplots": not skip_sessions,
+            "colors": self.colors,
+            "bw_method": bw_method,
+            "panels": panels,
+        }, render_profiles)
 
         df_stats = pd.concat(list_stats, axis=1)
         df_stats.columns = sessions
         df_stats.index.name=f'(Vol Return Stats:- Interval:{interval_val}, Symbol:{tickersymbol_val})'
-        df_stats.to_csv(
-            os.path.join(
-                self.output_folder,
-                f"{tickersymbol_val}_{interval_val}_Volatility_Returns_stats.csv",
-            )
-        )
+        self._save_csv(df_stats, f"{tickersymbol_val}_{interval_val}_Volatility_Returns_stats.csv")
         print(df_stats.round(1))
 
 
-    def tag_events(self, ev, pc):
+    @staticmethod
+    def get_monthly_windows():
+        """
+        Seasonal windows covering every calendar month, for get_seasonal_window_stats.
+
+        Returns:
+            dict: Month name mapped to its [month, first day, last day] window.
+        """
+        return {
+            datetime.strptime(str(month), '%m').strftime('%B'): [month, 1, 31]
+            for month in range(1, 13)
+        }
+
+    def _get_window_masks(self, day_frame, windows):
+        """
+        Checks every window against the same frame of days. The day keys are
+        computed once for the frame and reused by every window.
+        """
+        masks = {}
+        for window_id, window in windows.items():
+            # A window is a [month, day1, day2] filter, a dict of get_date_mask arguments,
+            # or a list of such dicts (eg the FOMC weeks of several years)
+            if isinstance(window, list) and len(window) > 0 and isinstance(window[0], dict):
+                specs = window
+            else:
+                specs = [window]
+            mask = np.zeros(len(day_frame), dtype=bool)
+            for spec in specs:
+                if isinstance(spec, dict):
+                    mask |= self.get_date_mask(day_frame, **spec)
+                else:
+                    mask |= self.get_date_mask(day_frame, month_day_filter=list(spec))
+            masks[window_id] = mask
+        return masks
+
+    def get_seasonal_window_stats(self, filtered_df, windows, tickersymbol_val, interval_val, save=True):
+        """
+        Return and volatility return statistics of many seasonal windows in one pass.
+
+        The day (and session) aggregates of filtered_df are computed once. Every window
+        only selects days from them, so tagging, nonevent filtering and aggregation are
+        not repeated per window. All the windows are then described in one groupby on
+        (window, session, return type).
+
+        Args:
+            filtered_df (pd.DataFrame): Tagged and filtered bars, as passed to the plotting methods.
+            windows (dict or list): Window id mapped to its window, or a list of windows named
+                                    after their dates. A window is a [month, day1, day2] filter like
+                                    month_day_filter, a dict of get_date_mask arguments
+                                    (eg {"start_date": "2024-01-29", "end_date": "2024-02-02"}),
+                                    or a list of such dicts. Windows may overlap, but a list must
+                                    not repeat a month filter, as the windows are named after it.
+            tickersymbol_val (str): Ticker symbol used in the output file name.
+            interval_val (str): Interval of the bars, eg '1h' or '1d'.
+            save (bool, optional): Write the table to the output folder. Default is True.
+
+        Returns:
+            pd.DataFrame: One row per (window, session, return type) with the describe()
+                          statistics, skewness, kurtosis and the latest return of the window.
+        """
+        if not isinstance(windows, dict):
+            month_to_name = (lambda a, b, c: f"{datetime.strptime(str(a), '%m').strftime('%B')}: {b}-{c}")
+            named_windows = {}
+            for i, window in enumerate(windows, 1):
+                if isinstance(window, (list, tuple)) and len(window) == 3 and not isinstance(window[0], dict):
+                    name = month_to_name(*window)
+                else:
+                    name = f"Window {i}"
+                # The stats are grouped by name, a second window of the same name would be merged into the first
+                if name in named_windows:
+                    raise ValueError(f"Duplicate seasonal window '{name}'. Pass a dict to name the windows.")
+                named_windows[name] = window
+            windows = named_windows
+
+        # Day aggregates of all the sessions and of the whole day, computed once
+        aggregates = self._get_all_day_and_session_table(filtered_df)
+        if 'd' in interval_val:
+            aggregates = aggregates[aggregates["session"] == "All day"]
+        # The cached table is shared, its session column is replaced on a copy
+        aggregates = aggregates.copy()
+        # Sessions outside the schema (eg "Other") are not plotted and not described
+        aggregates["session"] = pd.Categorical(aggregates["session"], categories=self.sessions)
+        aggregates = aggregates.dropna(subset=["session"]).sort_values("date", kind="stable")
+
+        returns = pd.concat(
+            [
+                aggregates[["date", "session", "return"]].assign(return_type="Returns"),
+                aggregates[["date", "session", "volatility_return"]]
+                .rename(columns={"volatility_return": "return"})
+                .assign(return_type="Volatility Returns"),
+            ],
+            ignore_index=True,
+        )
+
+        # Repeat the rows of every window so that one groupby covers all of them
+        day_frame = pd.DataFrame({"timestamp": pd.to_datetime(returns["date"])})
+        masks = self._get_window_masks(day_frame, windows)
+        rows = [np.flatnonzero(mask) for mask in masks.values()]
+        window_returns = returns.take(np.concatenate(rows))
+        window_returns.insert(
+            0,
+            "window",
+            pd.Categorical(
+                np.repeat(list(masks.keys()), [len(r) for r in rows]),
+                categories=list(masks.keys()),
+            ),
+        )
+
+        grouped = window_returns.groupby(["window", "session", "return_type"], observed=True)["return"]
+        window_stats = grouped.describe(percentiles=DESCRIBE_PERCENTILES)
+        window_stats["skewness"] = grouped.skew()
+        window_stats["kurtosis"] = grouped.apply(lambda x: x.kurtosis())
+        window_stats["latest"] = grouped.last()
+        window_stats = window_stats.reset_index()
+
+        if save:
+            self._save_csv(
+                window_stats, f"{tickersymbol_val}_{interval_val}_Seasonal_Windows_stats.csv", index=False
+            )
+        print(window_stats.round(1))
+        return window_stats
+
+    def tag_events(self, ev, pc, how="outer", return_event_rows=False):
+        """
+        Tags the price bars with the economic events.
+
+        Args:
+            ev (pd.DataFrame): Events with a "datetime" column and the event flags.
+            pc (pd.DataFrame): Price bars with a "timestamp" column.
+            how (str, optional): "outer" merges prices and events into one frame, including
+                                 event-only rows. "bars" attaches the event flags to the price
+                                 bars with a timestamp lookup and keeps the numeric dtypes.
+                                 Default is "outer".
+            return_event_rows (bool, optional): With how="bars", also return the events that
+                                                do not fall on any bar. Default is False.
+
+        Returns:
+            pd.DataFrame: Tagged data, or (tagged data, event rows) if return_event_rows is True.
+        """
+        if how == "bars":
+            return self._tag_events_on_bars(ev, pc, return_event_rows)
+        elif how != "outer":
+            raise ValueError("Invalid value for how. Use 'outer' or 'bars'.")
+
         events_df = ev.copy()
         price_df = pc.copy()
 
@@ -537,3 +1057,47 @@ class Returns:
         ordered_columns = [i for i in ordered_columns if i not in remove_columns]
         final_df = final_df.reindex(columns=ordered_columns, fill_value="na")
         return final_df
+
+    def _tag_events_on_bars(self, ev, pc, return_event_rows=False):
+        """
+        Attaches the event flags to the price bars without building an outer frame.
+        Events sharing a timestamp are combined: flags by max, tier by min and
+        event names joined with "; ".
+        """
+        price_df = pc.sort_values("timestamp", kind="stable")
+        events_df = ev.rename(columns={"datetime": "timestamp"})
+        events_df = events_df.drop(columns=["year"], errors="ignore")
+
+        # Compare both timestamps in the timezone of the price bars
+        price_tz = price_df["timestamp"].dt.tz
+        if price_tz is not None and events_df["timestamp"].dt.tz is not None:
+            events_df["timestamp"] = events_df["timestamp"].dt.tz_convert(price_tz)
+
+        events_columns = [col for col in events_df.columns if col != "timestamp"]
+        aggregations = {}
+        for col in events_columns:
+            if str(col).lower() in ["tier", "tiers"]:
+                aggregations[col] = "min"
+            elif pd.api.types.is_numeric_dtype(events_df[col]):
+                aggregations[col] = "max"
+            else:
+                aggregations[col] = lambda names: "; ".join(names.astype(str).unique())
+        event_flags = events_df.groupby("timestamp").agg(aggregations)
+
+        final_df = price_df.join(event_flags, on="timestamp")
+        for col in events_columns:
+            if str(col).startswith("IND_"):
+                final_df[col] = final_df[col].fillna(0).astype("int8")
+            elif str(col).lower() in ["tier", "tiers"]:
+                final_df[col] = final_df[col].astype("Int8")
+
+        final_df["year"] = (final_df["timestamp"].dt.year).astype("Int64")
+        common_columns = ["timestamp", "year", "session"]
+        price_columns = [col for col in price_df.columns if col not in common_columns]
+        ordered_columns = common_columns + events_columns + price_columns
+        final_df = final_df.reindex(columns=ordered_columns, fill_value="na")
+
+        if return_event_rows:
+            event_rows = ev[~events_df["timestamp"].isin(price_df["timestamp"]).to_numpy()]
+            return (final_df, event_rows)
+        return final_df
@@ -3,10 +3,26 @@ from intradaydata import Intraday
 from preprocessing import ManipulateTimezone
 from events import Events
 from returns import Returns
-from nonevents import Nonevents
+from nonevents import Nonevents, EventWindowIndex, NONEVENT_TIME_WINDOWS
+from render import RenderPool
+from session_store import SessionReturnStore
+from manifest import FileManifest, get_file_hash
+from stage_cache import StageCache
+from events_store import EventsStore
+from frame_store import FrameStore
+from instrumentation import RunReport, stage
 from periodic_runner_main import INTRADAY_FILES as Intraday_data_files
-import shutil
 import os
+import multiprocessing
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import matplotlib
+
+# Versions of the code of the cached stages, part of their stage cache keys. Bump one when
+# a change to the code changes its outputs, so that the stage runs again for every ticker.
+PROCESSED_STAGE_VERSION = 1 # Tagging and nonevents
+STATS_STAGE_VERSION = 1 # Stats and plots
+
 
 def _change_event_tiers(
     events_data_folder,
@@ -27,7 +43,9 @@ def _change_event_tiers(
         target_tz (str): The target timezone for the processed data. Default is "US/Eastern".
 
     Returns:
-        str: Path to the final processed file with timestamps in the target timezone.
+        tuple: Processed events with timestamps in the target timezone and int8 tiers and flags,
+               and the path of the final processed file. The events are loaded from the events
+               store of the processed folder while the workbook and the dictionaries are unchanged.
     """
     # Define file paths
     events_excel_path = os.path.join(events_data_folder, events_data_path)
@@ -72,12 +90,23 @@ def _change_event_tiers(
         "IND_FED": ["FOMC", "Speech", "Beige", "Speak"],
     }
 
+    # Reuse the processed events while the workbook and the dictionaries are unchanged
+    events_store = EventsStore(processed_data_folder, events_data_path)
+    events_parameters = {
+        "tier_dic": my_tier_dic, "flag_dic": my_flag_dic, "default_tz": default_tz, "target_tz": target_tz
+    }
+    combined_excel_target_tz = events_store.load(events_excel_path, **events_parameters)
+    if combined_excel_target_tz is not None and os.path.exists(combined_excel_target_tz_path):
+        print(f"Events unchanged, loaded from {events_store.data_path}")
+        return (combined_excel_target_tz, combined_excel_target_tz_path)
+
     # Create Events class instance
     myevents = Events(events_excel_path, my_tier_dic, my_flag_dic)
 
     # Save combined events
     combined_excel = myevents.combined_excel
     myevents.save_sheet(combined_excel, combined_excel_path)
+    FileManifest.open(processed_data_folder).record(combined_excel_path, rows=len(combined_excel))
 
     # Manipulate the Timezone
     myeventsobject = ManipulateTimezone(pd.read_csv(combined_excel_path))
@@ -89,11 +118,24 @@ def _change_event_tiers(
     )
 
     myevents.save_sheet(combined_excel_target_tz, combined_excel_target_tz_path)
+    FileManifest.open(processed_data_folder).record(combined_excel_target_tz_path, rows=len(combined_excel_target_tz))
+
+    combined_excel_target_tz = EventsStore.get_typed_events(combined_excel_target_tz)
+    events_store.save(combined_excel_target_tz, events_excel_path, **events_parameters)
+    FileManifest.open(processed_data_folder).record(events_store.data_path, rows=len(combined_excel_target_tz))
 
     # Return the path to the final processed file
     return (combined_excel_target_tz, combined_excel_target_tz_path)
 
 
+def _get_date_range(df):
+    # First and last date of the bars, recorded in the manifest
+    timestamps = pd.to_datetime(df["timestamp"])
+    if timestamps.dropna().empty:
+        return {"start_date": None, "end_date": None}
+    return {"start_date": str(timestamps.min().date()), "end_date": str(timestamps.max().date())}
+
+
 def _get_distribution_of_returns(
     mytickers='NotDefined',
     interval='NotDefined',
@@ -105,7 +147,15 @@ def _get_distribution_of_returns(
     
     skip_data_fetching=False,
     pre_fed_data="",
-    month_day_filter=[]#Don't filter dates by default
+    month_day_filter=[],#Don't filter dates by default
+    event_index=None,
+    render_pool=None,
+    render_profiles=("preview",),
+    seasonal_windows=None,
+    session_store=None,
+    quantile_backend="exact",
+    kernel_backend="pandas",
+    frame_store=None
 ):
     """
     Processes intraday data for a given list of tickers, performs tagging, filtering, and generates output files.
@@ -117,12 +167,25 @@ def _get_distribution_of_returns(
         end_intraday (int): End date offset in days for fetching intraday data.
         combined_excel_target_tz (str): Path to the events Excel file with target timezone data.
         processed_data_folder (str): Folder path to save processed files.
+        event_index (EventWindowIndex): Prebuilt event windows shared across tickers.
+                                        If not provided, events are rediscovered from the tagged data.
+        render_pool (RenderPool): Pool to render the figures in. If not provided, figures are rendered in this process.
+        render_profiles (tuple): Render profiles of the figures, eg ("preview",) or ("preview", "print").
+        seasonal_windows (dict or list): Seasonal windows described together in one stats table,
+                                         see Returns.get_seasonal_window_stats. Default is none.
+        session_store (SessionReturnStore): Store of the session aggregates. If provided, only the
+                                            new days are aggregated. Not used with month_day_filter.
+        quantile_backend (str): "exact" (default) or "sketch" for approximate percentiles of long histories.
+        kernel_backend (str): "pandas" (default) or "numba" for the compiled session aggregation kernel.
+        frame_store (FrameStore): Format of the processed files. Default is Parquet without csv export.
 
     Returns:
         dict: Paths of the processed files.
     """
     data = None
     ticker_symbol = None
+    if frame_store is None:
+        frame_store = FrameStore()
 
     if int(skip_data_fetching) == 0 and pre_fed_data == "":
         # Data Acquisition
@@ -141,55 +204,91 @@ def _get_distribution_of_returns(
         data = pre_fed_data[0]
         ticker_symbol = pre_fed_data[1]
 
-    # Data Preprocessing: Change the timezone of the historical data to target timezone
-    preprocessing_obj = ManipulateTimezone(data)
-    data_target_tz = preprocessing_obj.change_timezone(
-        checkdf=data, tz_col="timestamp", default_tz="UTC", target_tz="US/Eastern"
-    )
+    with stage("tagging", ticker=ticker_symbol, interval=interval) as record:
+        # Data Preprocessing: Change the timezone of the historical data to target timezone
+        preprocessing_obj = ManipulateTimezone(data)
+        data_target_tz = preprocessing_obj.change_timezone(
+            checkdf=data, tz_col="timestamp", default_tz="UTC", target_tz="US/Eastern"
+        )
 
-    # Event Tagging
-    returns_obj = Returns(dataframe=data_target_tz,output_folder=myoutput_folder)
-    tagged_data = returns_obj.tag_events(
-        (combined_excel_target_tz), returns_obj.dataframe.copy()
-    )
+        # Event Tagging
+        returns_obj = Returns(dataframe=data_target_tz,output_folder=myoutput_folder,render_pool=render_pool,render_profiles=render_profiles,quantile_backend=quantile_backend,kernel_backend=kernel_backend)
+        # With prebuilt event windows, event-only rows are not needed for the nonevents filter
+        tagged_data = returns_obj.tag_events(
+            (combined_excel_target_tz), returns_obj.dataframe,
+            how="outer" if event_index is None else "bars"
+        )
 
-    # Filtering Data
-    if month_day_filter==[]:
-        filtered_dates=""
-    else:
-        filtered_dates="_filtered_dates"
-    filtered_data = returns_obj.filter_date(
-        filter_df=tagged_data, month_day_filter=month_day_filter, to_sessions=True
-    )
-    filtered_data_path = os.path.join(
-        processed_data_folder,
-        f"{ticker_symbol}_{interval}{filtered_dates}_events_tagged_target_tz.csv",
-    )
-    if "Datetime" in (filtered_data.columns):
-        filtered_data.drop(axis=1, columns=["Datetime"], inplace=True)
-    filtered_data.to_csv(filtered_data_path, index=False)
-
-    # Filtering Nonevents
-    nonevents_obj = Nonevents(filtered_data)
-    nonevents_data = nonevents_obj.filter_nonevents(nonevents_obj.dataframe)
-    ne_filtered_data = nonevents_data[
-        ((nonevents_data["IND_NE_remove"] == 0) & (~nonevents_data["Volume"].isnull()))
-    ]
-    ne_filtered_data_path = os.path.join(
-        processed_data_folder,
-        f"{ticker_symbol}_{interval}{filtered_dates}_events_tagged_target_tz_nonevents.csv",
-    )
-    ne_filtered_data.to_csv(ne_filtered_data_path, index=False)
+        # Filtering Data
+        if month_day_filter==[]:
+            filtered_dates=""
+        else:
+            filtered_dates="_filtered_dates"
+        filtered_data = returns_obj.filter_date(
+            filter_df=tagged_data, month_day_filter=month_day_filter, to_sessions=True
+        )
+        filtered_data_path_stem = os.path.join(
+            processed_data_folder,
+            f"{ticker_symbol}_{interval}{filtered_dates}_events_tagged_target_tz",
+        )
+        if "Datetime" in (filtered_data.columns):
+            filtered_data.drop(axis=1, columns=["Datetime"], inplace=True)
+        for filtered_data_path in frame_store.save(filtered_data, filtered_data_path_stem):
+            FileManifest.open(processed_data_folder).record(
+                filtered_data_path, rows=len(filtered_data), **_get_date_range(filtered_data)
+            )
+        record["rows"] = len(filtered_data)
+
+    with stage("nonevents", ticker=ticker_symbol, interval=interval) as record:
+        # Filtering Nonevents
+        nonevents_obj = Nonevents(filtered_data)
+        nonevents_data = nonevents_obj.filter_nonevents(nonevents_obj.dataframe, event_index=event_index)
+        ne_filtered_data = nonevents_data[
+            ((nonevents_data["IND_NE_remove"] == 0) & (~nonevents_data["Volume"].isnull()))
+        ]
+        ne_filtered_data_paths = frame_store.save(
+            ne_filtered_data,
+            os.path.join(processed_data_folder, f"{ticker_symbol}_{interval}{filtered_dates}_events_tagged_target_tz_nonevents"),
+        )
+        for path in ne_filtered_data_paths:
+            FileManifest.open(processed_data_folder).record(
+                path, rows=len(ne_filtered_data), **_get_date_range(ne_filtered_data)
+            )
+        ne_filtered_data_path = ne_filtered_data_paths[0]
+        record["rows"] = len(ne_filtered_data)
 
     
-    _get_stats_plots(
-        returns_obj, ne_filtered_data, tickersymbol=ticker_symbol, interval=interval
-    )
+    with stage("stats_plots", ticker=ticker_symbol, interval=interval, rows=len(ne_filtered_data)):
+        _get_stats_plots(
+            returns_obj, ne_filtered_data, tickersymbol=ticker_symbol, interval=interval,
+            seasonal_windows=seasonal_windows,
+            # The store holds the full history, so it cannot serve a month-day filtered frame
+            session_store=session_store if month_day_filter == [] else None
+        )
 
     return (ne_filtered_data, ne_filtered_data_path)
 
 
-def _get_stats_plots(my_returns_object, ne_filtered_data, tickersymbol, interval):
+def _read_processed(my_returns_object, processed_data_path, month_day_filter=[]):
+    # Reads a tagged nonevents file back with the timestamps and sessions of _get_distribution_of_returns
+    processed_data = FrameStore.load(processed_data_path)
+    processed_data["timestamp"] = pd.to_datetime(processed_data["timestamp"], utc=True).dt.tz_convert("US/Eastern")
+    return my_returns_object.filter_date(
+        filter_df=processed_data, month_day_filter=month_day_filter, to_sessions=True
+    )
+
+
+def _get_stats_plots(
+    my_returns_object, ne_filtered_data, tickersymbol, interval, seasonal_windows=None, session_store=None
+):
+
+    # Serve the aggregates from the store, aggregating only the days since the last run.
+    # Days stored with other events are aggregated again.
+    if session_store is not None:
+        my_returns_object.update_session_store(
+            session_store, ne_filtered_data, tickersymbol, interval,
+            rebuild=session_store.is_stale(tickersymbol, interval)
+        )
 
     # Data Visualization:
     # 1. Daily Session Returns
@@ -210,80 +309,358 @@ def _get_stats_plots(my_returns_object, ne_filtered_data, tickersymbol, interval
         ne_filtered_data, tickersymbol, interval
     )
 
+    # 3. Seasonal windows, sliced from the same aggregates as the plots
+    if seasonal_windows:
+        my_returns_object.get_seasonal_window_stats(
+            ne_filtered_data, seasonal_windows, tickersymbol, interval
+        )
 
-def scan_folder_and_calculate_returns(
-        ticker_match_tuple,
-        input_folder,
-        processed_folder,
-        output_folder,
-        final_events_data,
+    # The aggregates of ne_filtered_data are shared by the steps above only
+    my_returns_object.clear_aggregate_cache()
+
+
+def _calculate_returns_of_file(
+        job, final_events_data, processed_folder, output_folder, event_index=None,
+        render_pool=None, session_store=None, frame_store=None, **options
         ):
-   
-    for tickersymbol,tickerinterval in ticker_match_tuple:
-        csvfile='NA'
-        for csvfile in os.scandir(input_folder):
-            if 'stats' in csvfile.name:
-                continue
-            if csvfile.is_file() and csvfile.name.endswith('.csv') and (csvfile.name.split('_'))[2]==tickersymbol and (csvfile.name.split('_'))[3]==tickerinterval:
-                    break
-        if csvfile=='NA':
-            continue
-        csvdata=pd.read_csv(csvfile)
+    """
+    Runs the tagging, nonevents, stats and plots of one (ticker, interval) data file.
+
+    Args:
+        job (dict): ticker, interval, data_path of the data file and processed_path of the
+                    nonevents file to reuse when only the stats parameters changed, else None.
+        options: render_profiles, seasonal_windows, quantile_backend and kernel_backend,
+                 see _get_distribution_of_returns.
+
+    Returns:
+        str: Path of the nonevents file.
+    """
+    tickersymbol, tickerinterval = job["ticker"], job["interval"]
+
+    if job["processed_path"] is not None:
+        # Only the stats parameters changed: reuse the nonevents file
+        print(f'{tickersymbol} {tickerinterval} stats parameters changed, reusing {job["processed_path"]}')
+        returns_obj = Returns(
+            output_folder=output_folder, render_pool=render_pool, render_profiles=options["render_profiles"],
+            quantile_backend=options["quantile_backend"], kernel_backend=options["kernel_backend"]
+        )
+        with stage("stats_plots", ticker=tickersymbol, interval=tickerinterval) as record:
+            final_data = _read_processed(returns_obj, job["processed_path"])
+            _get_stats_plots(
+                returns_obj, final_data, tickersymbol=tickersymbol, interval=tickerinterval,
+                seasonal_windows=options["seasonal_windows"], session_store=session_store
+            )
+            record["rows"] = len(final_data)
+        return job["processed_path"]
+
+    with stage("read_data", ticker=tickersymbol, interval=tickerinterval) as record:
+        csvdata=pd.read_csv(job["data_path"])
 
         if 'd' in tickerinterval: #Add time to DATE and make it "DATE + 23:59:00" if interval >=1d
             csvdata=ManipulateTimezone.add_time_for_d_intervals(csvdata,csvdata.columns[0])
 
-        
+    
 
         csvdata.dropna(inplace=True,axis=0)
         csvdata['timestamp']=csvdata['Datetime']
         csvdata.reset_index(drop=True,inplace=True)
         print(csvdata.tail())
+        record["rows"] = len(csvdata)
+
+    (final_data, final_data_path) = _get_distribution_of_returns(
+        combined_excel_target_tz=final_events_data,
+        processed_data_folder=processed_folder,
+        pre_fed_data=[csvdata, tickersymbol],
+        skip_data_fetching=True,
+        myoutput_folder=output_folder,
+        interval=tickerinterval,
+        month_day_filter=[],#[12, 15, 31] 12: December, 15: Start Date, 31: End Date
+        event_index=event_index,
+        render_pool=render_pool,
+        session_store=session_store,
+        frame_store=frame_store,
+        **options
+    )
+    print(f"Processed files saved at: {final_data_path}")
+    print(final_data)
+    return final_data_path
+
+
+def _get_recorded_hash(manifest, path):
+    # Hash of a file from the record written with it, hashed again only if it is not recorded
+    record = manifest.get_record(path)
+    if record is None or record.get("sha256") is None:
+        return get_file_hash(path)
+    return record["sha256"]
+
+
+def _prune_outputs(folders, ticker_intervals, stage_cache=None):
+    # The folders are updated in place, so the files of the (ticker, interval) pairs that are
+    # no longer produced are deleted here, with their stage cache entries
+    for folder in folders:
+        manifest = FileManifest.open(folder)
+        for record in manifest.find():
+            ticker_interval = (record.get("ticker"), record.get("interval"))
+            if ticker_interval[0] is None or ticker_interval in ticker_intervals:
+                continue
+            print(f'Deleting {manifest.get_path(record)}, {ticker_interval[0]} {ticker_interval[1]} is no longer produced')
+            manifest.delete(record)
+            if stage_cache is not None:
+                stage_cache.invalidate(f"{ticker_interval[0]}_{ticker_interval[1]}/processed")
+                stage_cache.invalidate(f"{ticker_interval[0]}_{ticker_interval[1]}/stats")
+
+
+# Shared state of a job worker, set once per worker by _init_job_worker
+_job_worker_state = {}
+
+
+def _init_job_worker(state):
+    # Workers never open windows and leave the manifests and the run report to the parent process
+    matplotlib.use("Agg")
+    FileManifest.defer_records()
+    RunReport("returns_main job worker", path=None, console=False).start()
+    _job_worker_state.update(state)
+
+
+def _run_job_in_worker(job):
+    # Failures are returned with the files written and the stages timed so far instead of raised
+    final_data_path, error = None, None
+    try:
+        final_data_path = _calculate_returns_of_file(job, **_job_worker_state)
+    except Exception:
+        error = traceback.format_exc()
+    return (
+        final_data_path, error, FileManifest.collect_deferred_records(), RunReport.get_active().collect_records()
+    )
+
+
+def scan_folder_and_calculate_returns(
+        ticker_match_tuple,
+        input_folder,
+        processed_folder,
+        output_folder,
+        final_events_data,
+        event_index=None,
+        render_workers=None,
+        render_profiles=("preview",),
+        seasonal_windows=None,
+        session_store_folder=None,
+        quantile_backend="exact",
+        kernel_backend="pandas",
+        stage_cache_path=None,
+        job_workers=None,
+        processed_format="parquet",
+        export_csv=False,
+        ):
+    """
+    Calculates the returns of every (ticker, interval) data file of the input folder.
 
-        (final_data, final_data_path) = _get_distribution_of_returns(
-            combined_excel_target_tz=final_events_data,
-            processed_data_folder=processed_folder,
-            pre_fed_data=[csvdata, tickersymbol],
-            skip_data_fetching=True,
-            myoutput_folder=output_folder,
-            interval=tickerinterval,
-            month_day_filter=[]#[12, 15, 31] 12: December, 15: Start Date, 31: End Date
+    Args:
+        ticker_match_tuple (tuple): (ticker, interval) pairs, eg (("ZN", "1h"), ("ZN", "1d")).
+        input_folder (str): Folder of the intraday data files.
+        processed_folder (str): Folder of the tagged and nonevents files.
+        output_folder (str): Folder of the stats and plots.
+        final_events_data (pd.DataFrame): Processed events, see _change_event_tiers.
+        stage_cache_path (str): Json file of the stage cache. If provided, the tagging and nonevents
+                                stage and the stats and plots stage of a (ticker, interval) are skipped
+                                when the data file, the events and the parameters did not change since
+                                the run that wrote their outputs. Default is no cache.
+        job_workers (int): Number of processes running the (ticker, interval) jobs in parallel. The events
+                           and the event windows are sent once to every worker, and figures are drawn by
+                           the worker of their job, so render_workers is not used. Default is to run the
+                           jobs one by one in this process. In both cases a failed job is reported and the
+                           other jobs go on.
+        session_store_folder (str): Folder of the SessionReturnStore kept between runs. The stored days
+                                    of a (ticker, interval) are aggregated again when the events changed.
+                                    Default is to aggregate the full history on every run.
+        processed_format (str): Format of the tagged and nonevents files: "parquet" (default), "feather" or "csv".
+        export_csv (bool): Also save the tagged and nonevents files as csv. Default is False.
+        The processed and output files of the (ticker, interval) pairs that are not in ticker_match_tuple,
+        or have no data file, are deleted at the end of the scan.
+        Other arguments are passed to _get_distribution_of_returns.
+
+    Returns:
+        dict: Traceback of every failed job by (ticker, interval).
+    """
+    # Build the event windows once and reuse them for every ticker and interval
+    if event_index is None:
+        event_index = EventWindowIndex(final_events_data, kernel_backend=kernel_backend)
+
+    # Statistics stay in this process; only the figures are drawn by the pool
+    render_pool = None
+    if render_workers and not job_workers:
+        render_pool = RenderPool(max_workers=render_workers)
+
+    frame_store = FrameStore(processed_format, export_csv=export_csv)
+
+    # The stored days of a (ticker, interval) are rebuilt when the events or the nonevent windows change
+    events_hash = StageCache.get_frame_hash(final_events_data)
+    month_day_filter = []
+    session_store = None
+    if session_store_folder:
+        session_store = SessionReturnStore(
+            session_store_folder,
+            key=StageCache.get_key(events_hash, NONEVENT_TIME_WINDOWS, month_day_filter),
         )
-        print(f"Processed files saved at: {final_data_path}")
-        print(final_data)
-        
+
+    # Data files are looked up in the manifest of the input folder instead of scanning it
+    data_manifest = FileManifest.open(input_folder)
+    # Hashes of the processed files for the stage cache keys are taken from their records
+    processed_manifest = FileManifest.open(processed_folder)
+
+    stage_cache = None
+    if stage_cache_path:
+        stage_cache = StageCache(stage_cache_path)
+        stats_parameters = {
+            "render_profiles": list(render_profiles),
+            "seasonal_windows": seasonal_windows,
+            "quantile_backend": quantile_backend,
+        }
+
+    jobs = []
+    # (ticker, interval) pairs with a data file, their outputs are kept
+    ticker_intervals = set()
+    for tickersymbol,tickerinterval in ticker_match_tuple:
+        data_record = data_manifest.get("intraday_data", tickersymbol, tickerinterval)
+        if data_record is None:
+            print(f'No data file found for {tickersymbol} {tickerinterval}')
+            continue
+        ticker_intervals.add((tickersymbol, tickerinterval))
+        job = {
+            "ticker": tickersymbol,
+            "interval": tickerinterval,
+            "data_path": data_manifest.get_path(data_record),
+            "processed_path": None,
+        }
+
+        if stage_cache is not None:
+            job["processed_stage"] = f"{tickersymbol}_{tickerinterval}/processed"
+            job["stats_stage"] = f"{tickersymbol}_{tickerinterval}/stats"
+            job["processed_key"] = StageCache.get_key(
+                PROCESSED_STAGE_VERSION, _get_recorded_hash(data_manifest, job["data_path"]),
+                events_hash, month_day_filter, str(frame_store)
+            )
+            if stage_cache.is_fresh(job["processed_stage"], job["processed_key"]):
+                processed_path = stage_cache.get_outputs(job["processed_stage"])[-1]
+                stats_key = StageCache.get_key(
+                    STATS_STAGE_VERSION, _get_recorded_hash(processed_manifest, processed_path), stats_parameters
+                )
+                if stage_cache.is_fresh(job["stats_stage"], stats_key):
+                    print(f'{tickersymbol} {tickerinterval} unchanged, skipped')
+                    continue
+                job["processed_path"] = processed_path
+        jobs.append(job)
+
+    state = {
+        "final_events_data": final_events_data,
+        "processed_folder": processed_folder,
+        "output_folder": output_folder,
+        "event_index": event_index,
+        "session_store": session_store,
+        "frame_store": frame_store,
+        "render_profiles": render_profiles,
+        "seasonal_windows": seasonal_windows,
+        "quantile_backend": quantile_backend,
+        "kernel_backend": kernel_backend,
+    }
+    completed = []
+    job_failures = {}
+    if job_workers and jobs:
+        # Manifests are written here from the records returned by the workers
+        FileManifest.open(processed_folder)
+        FileManifest.open(output_folder)
+        with ProcessPoolExecutor(
+            max_workers=job_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_job_worker,
+            initargs=(state,),
+        ) as executor:
+            futures = {executor.submit(_run_job_in_worker, job): job for job in jobs}
+            for future in as_completed(futures):
+                job = futures[future]
+                try:
+                    (final_data_path, error, records, stage_records) = future.result()
+                except Exception:
+                    # The worker itself died, eg out of memory
+                    (final_data_path, error, records, stage_records) = (None, traceback.format_exc(), [], [])
+                for folder, path, rows, fields in records:
+                    FileManifest.open(folder).record(path, rows=rows, **fields)
+                if RunReport.get_active() is not None:
+                    for stage_record in stage_records:
+                        RunReport.get_active().add(stage_record)
+                if error is not None:
+                    job_failures[(job["ticker"], job["interval"])] = error
+                    print(f'Job {job["ticker"]} {job["interval"]} failed:\n{error}')
+                    continue
+                completed.append((job, final_data_path))
+    else:
+        for job in jobs:
+            try:
+                final_data_path = _calculate_returns_of_file(job, render_pool=render_pool, **state)
+            except Exception:
+                # Same reporting as a failed job of the pool, the other jobs go on
+                error = traceback.format_exc()
+                job_failures[(job["ticker"], job["interval"])] = error
+                print(f'Job {job["ticker"]} {job["interval"]} failed:\n{error}')
+                continue
+            completed.append((job, final_data_path))
+
+    if stage_cache is not None:
+        for job, final_data_path in completed:
+            if job["processed_path"] is None:
+                tagged_data_path = final_data_path.replace("_nonevents.", ".")
+                outputs = [tagged_data_path, final_data_path]
+                if frame_store.export_csv:
+                    outputs = [frame_store.get_path(os.path.splitext(path)[0], "csv") for path in outputs] + outputs
+                # The nonevents file stays last, see the stage cache checks above
+                stage_cache.update(job["processed_stage"], job["processed_key"], outputs)
+            job["stats_key"] = StageCache.get_key(
+                STATS_STAGE_VERSION, _get_recorded_hash(processed_manifest, final_data_path), stats_parameters
+            )
+
+    failures = {}
+    if render_pool is not None:
+        with stage("render_wait"):
+            failures = render_pool.wait()
+
+    if stage_cache is not None:
+        # The outputs of a stats stage are the files recorded for its ticker and interval,
+        # recorded once their figures are rendered
+        output_manifest = FileManifest.open(output_folder)
+        failed_paths = {os.path.abspath(path) for path in failures}
+        for job, final_data_path in completed:
+            outputs = [
+                output_manifest.get_path(record)
+                for record in output_manifest.find(ticker=job["ticker"], interval=job["interval"])
+            ]
+            # A stage with a failed figure runs again next time
+            if any(os.path.abspath(path) in failed_paths for path in outputs):
+                stage_cache.invalidate(job["stats_stage"])
+                continue
+            stage_cache.update(job["stats_stage"], job["stats_key"], outputs)
+
+    _prune_outputs([processed_folder, output_folder], ticker_intervals, stage_cache=stage_cache)
+
+    if job_failures:
+        print(f'{len(job_failures)} of {len(jobs)} jobs failed: {sorted(job_failures)}')
+    return job_failures
+
 folder_events= 'Input_data'
 folder_input = Intraday_data_files
 folder_output = Intraday_data_files+'_stats_and_plots_folder'
 folder_processed = Intraday_data_files+'_processed_folder'
+folder_session_store = Intraday_data_files+'_session_store'
 
 if __name__ == "__main__":
     folder_events= 'Input_data'
     folder_input = Intraday_data_files
     folder_output = Intraday_data_files+'_stats_and_plots_folder'
     folder_processed = Intraday_data_files+'_processed_folder'
+    folder_session_store = Intraday_data_files+'_session_store' # Kept between runs
    
-    # Delete the directory and its contents
-    try:
-        shutil.rmtree(folder_output)
-        print(f"Directory '{folder_output}' and its contents have been deleted successfully.")
-    except FileNotFoundError:
-        print(f"Directory '{folder_output}' does not exist.")
-    except PermissionError:
-        print(f"Permission denied to delete '{folder_output}'.")
-
-
-    try:
-        shutil.rmtree(folder_processed)
-        print(f"Directory '{folder_processed}' and its contents have been deleted successfully.")
-    except FileNotFoundError:
-        print(f"Directory '{folder_processed}' does not exist.")
-    except PermissionError:
-        print(f"Permission denied to delete '{folder_processed}'.")
-
-
-    os.makedirs(folder_processed)#exist_ok=True)
-    os.makedirs(folder_output)#exist_ok=True)
+    # Outputs are updated in place; the stage cache skips the tickers whose inputs did not change
+    os.makedirs(folder_processed, exist_ok=True)
+    os.makedirs(folder_output, exist_ok=True)
    
     myevents_path = "EconomicEventsSheet15-24.xlsx"
     ticker_match_tuple=(("ZN",'1m'),("ZN",'15m'),("ZN",'1h'),('ZN','1d'),
@@ -292,17 +669,28 @@ if __name__ == "__main__":
                          ("ZF",'1m')
                         )
 
-    (final_events_data, final_path) = _change_event_tiers(
-        events_data_folder=folder_events,
-        processed_data_folder=folder_processed,
-        events_data_path=myevents_path,
-    )
+    # Timings of every stage are appended to logs/run_report.jsonl and summarised at the end
+    report = RunReport("returns_main").start()
+    with stage("events") as record:
+        (final_events_data, final_path) = _change_event_tiers(
+            events_data_folder=folder_events,
+            processed_data_folder=folder_processed,
+            events_data_path=myevents_path,
+        )
+        record["rows"] = len(final_events_data)
     print(f"Processed Events file saved at: {final_path}")
     scan_folder_and_calculate_returns(
         ticker_match_tuple,
         folder_input,
         folder_processed,
         folder_output,
-        final_events_data
+        final_events_data,
+        render_workers=os.cpu_count(),
+        job_workers=None, # eg os.cpu_count() to run the tickers and intervals in parallel processes
+        processed_format="parquet", # "feather" or "csv"; add export_csv=True to also save csv copies
+        render_profiles=("preview",), # Add "print" for 300 dpi images in the "print" subfolder
+        seasonal_windows=None, # eg Returns.get_monthly_windows() for the stats of every month
+        session_store_folder=folder_session_store,
+        stage_cache_path=os.path.join(folder_processed, "stage_cache.json")
     )
-
+    report.finish()
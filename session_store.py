@@ -0,0 +1,210 @@
+import os
+import json
+import pandas as pd
+from moments import MomentAccumulator
+from quantiles import KLLSketch, PercentileIndex
+
+
+class SessionReturnStore:
+    """
+    Persists the day and session aggregates of every (ticker, interval), so that
+    a run only has to aggregate the days that changed since the previous run.
+
+    The aggregates of a (ticker, interval) are kept in one csv file. The rows of
+    the whole day are stored with the session "All day". The moment accumulators
+    and the quantile sketches or percentile indexes of every session are kept next
+    to it in json files.
+
+    The stored days are only valid for the events they were filtered with. The store
+    can be given a key of those inputs (eg the hash of the events); the key is saved
+    with the aggregates, and a (ticker, interval) stored with another key is stale.
+    """
+    def __init__(self, store_folder="session_returns_store", key=None):
+        self.store_folder = store_folder
+        self.key = key
+        os.makedirs(self.store_folder, exist_ok=True)
+
+    def __str__(self):
+        return f'SessionReturnStore at {self.store_folder}'
+
+    def get_path(self, tickersymbol, interval):
+        return os.path.join(self.store_folder, f"{tickersymbol}_{interval}_session_returns.csv")
+
+    def load(self, tickersymbol, interval):
+        """
+        Reads the stored aggregates of a (ticker, interval).
+
+        Args:
+            tickersymbol (str): Ticker symbol, eg 'ZN'.
+            interval (str): Interval of the bars, eg '1h'.
+
+        Returns:
+            pd.DataFrame: Stored aggregates with the dates as datetime.date, or None if nothing is stored.
+        """
+        path = self.get_path(tickersymbol, interval)
+        if not os.path.exists(path):
+            return None
+        # round_trip keeps the stored floats identical to the ones computed in memory
+        stored = pd.read_csv(path, float_precision="round_trip")
+        stored["date"] = pd.to_datetime(stored["date"]).dt.date
+        return stored
+
+    def get_last_date(self, tickersymbol, interval):
+        stored = self.load(tickersymbol, interval)
+        if stored is None or stored.empty:
+            return None
+        return stored["date"].max()
+
+    def upsert(self, tickersymbol, interval, aggregates):
+        """
+        Replaces the stored days from the first date of aggregates onwards and saves the store.
+
+        Args:
+            tickersymbol (str): Ticker symbol, eg 'ZN'.
+            interval (str): Interval of the bars, eg '1h'.
+            aggregates (pd.DataFrame): Recomputed aggregates with date and session columns.
+
+        Returns:
+            pd.DataFrame: All the stored aggregates after the update.
+        """
+        stored = self.load(tickersymbol, interval)
+        if stored is not None and not aggregates.empty:
+            stored = stored[stored["date"] < aggregates["date"].min()]
+        if stored is None or stored.empty:
+            stored = aggregates
+        else:
+            stored = pd.concat([stored, aggregates], ignore_index=True)
+        stored.to_csv(self.get_path(tickersymbol, interval), index=False)
+        return stored
+
+    def get_key_path(self, tickersymbol, interval):
+        return os.path.join(self.store_folder, f"{tickersymbol}_{interval}_session_key.json")
+
+    def load_key(self, tickersymbol, interval):
+        path = self.get_key_path(tickersymbol, interval)
+        if not os.path.exists(path):
+            return None
+        with open(path) as file:
+            return json.load(file)["key"]
+
+    def save_key(self, tickersymbol, interval):
+        with open(self.get_key_path(tickersymbol, interval), "w") as file:
+            json.dump({"key": self.key}, file)
+
+    def is_stale(self, tickersymbol, interval):
+        """
+        Checks if the stored aggregates of a (ticker, interval) were built with another key
+        than the one of the store, eg before the events changed. Never stale without a key.
+        """
+        if self.key is None or not os.path.exists(self.get_path(tickersymbol, interval)):
+            return False
+        return self.load_key(tickersymbol, interval) != self.key
+
+    def get_moments_path(self, tickersymbol, interval):
+        return os.path.join(self.store_folder, f"{tickersymbol}_{interval}_session_moments.json")
+
+    def get_sketches_path(self, tickersymbol, interval):
+        return os.path.join(self.store_folder, f"{tickersymbol}_{interval}_session_sketches.json")
+
+    def get_indexes_path(self, tickersymbol, interval):
+        return os.path.join(self.store_folder, f"{tickersymbol}_{interval}_session_indexes.json")
+
+    @staticmethod
+    def _load_state(path, field, from_state):
+        # Settled days state of the moments or the sketches, see load_moments
+        if not os.path.exists(path):
+            return None
+        with open(path) as file:
+            state = json.load(file)
+        state["first_date"] = pd.Timestamp(state["first_date"]).date()
+        state["settled_date"] = pd.Timestamp(state["settled_date"]).date()
+        state.setdefault("key", None)
+        state[field] = {
+            column: {session: from_state(values) for session, values in sessions.items()}
+            for column, sessions in state[field].items()
+        }
+        return state
+
+    def _save_state(self, path, first_date, settled_date, field, values, to_state):
+        state = {
+            "first_date": str(first_date),
+            "settled_date": str(settled_date),
+            "key": self.key,
+            field: {
+                column: {session: to_state(value) for session, value in sessions.items()}
+                for column, sessions in values.items()
+            },
+        }
+        with open(path, "w") as file:
+            json.dump(state, file, indent=2)
+
+    def load_moments(self, tickersymbol, interval):
+        """
+        Reads the stored moment accumulators of a (ticker, interval).
+
+        Returns:
+            dict: "first_date" and "settled_date" of the accumulated days, the "key" of the store
+                  they were saved with, and "moments" with a MomentAccumulator per return column
+                  and session. None if nothing is stored.
+        """
+        return self._load_state(self.get_moments_path(tickersymbol, interval), "moments", MomentAccumulator.from_list)
+
+    def save_moments(self, tickersymbol, interval, first_date, settled_date, moments):
+        """
+        Saves the moment accumulators of the days from first_date up to (not including) settled_date,
+        with the key of the store.
+        """
+        self._save_state(
+            self.get_moments_path(tickersymbol, interval), first_date, settled_date, "moments", moments,
+            lambda accumulator: accumulator.to_list()
+        )
+
+    def load_sketches(self, tickersymbol, interval):
+        """
+        Reads the stored quantile sketches of a (ticker, interval), in the layout of load_moments
+        with "sketches" holding a KLLSketch per return column and session.
+        """
+        return self._load_state(self.get_sketches_path(tickersymbol, interval), "sketches", KLLSketch.from_dict)
+
+    def save_sketches(self, tickersymbol, interval, first_date, settled_date, sketches):
+        """
+        Saves the quantile sketches of the days from first_date up to (not including) settled_date,
+        with the key of the store.
+        """
+        self._save_state(
+            self.get_sketches_path(tickersymbol, interval), first_date, settled_date, "sketches", sketches,
+            lambda sketch: sketch.to_dict()
+        )
+
+    def load_indexes(self, tickersymbol, interval):
+        """
+        Reads the stored percentile indexes of a (ticker, interval), in the layout of load_moments
+        with "indexes" holding a PercentileIndex per return column and session.
+        """
+        return self._load_state(self.get_indexes_path(tickersymbol, interval), "indexes", PercentileIndex.from_dict)
+
+    def save_indexes(self, tickersymbol, interval, first_date, settled_date, indexes):
+        """
+        Saves the percentile indexes of the days from first_date up to (not including) settled_date,
+        with the key of the store.
+        """
+        self._save_state(
+            self.get_indexes_path(tickersymbol, interval), first_date, settled_date, "indexes", indexes,
+            lambda index: index.to_dict()
+        )
+
+    def clear(self, tickersymbol, interval):
+        """
+        Deletes the stored aggregates, moments, sketches and indexes of a (ticker, interval), eg after the
+        events file changed and the nonevent filter of past days is no longer valid.
+        """
+        paths = [
+            self.get_path(tickersymbol, interval),
+            self.get_moments_path(tickersymbol, interval),
+            self.get_sketches_path(tickersymbol, interval),
+            self.get_indexes_path(tickersymbol, interval),
+            self.get_key_path(tickersymbol, interval),
+        ]
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
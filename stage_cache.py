@@ -0,0 +1,69 @@
+import os
+import json
+import hashlib
+import pandas as pd
+
+
+class StageCache:
+    """
+    Remembers the input key and the output files of every pipeline stage, so that a
+    stage is skipped when its inputs (file contents, events and parameters) have not
+    changed since the run that wrote its outputs.
+
+    The cache is kept in one json file, eg in the processed data folder.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.stages = {}
+        if os.path.exists(self.path):
+            with open(self.path) as file:
+                self.stages = json.load(file)
+
+    def __str__(self):
+        return f'StageCache at {self.path} with {len(self.stages)} stages'
+
+    @staticmethod
+    def get_key(*inputs):
+        """
+        Hash of the inputs of a stage: file hashes, frame hashes and parameters.
+        """
+        return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode()).hexdigest()
+
+    @staticmethod
+    def get_frame_hash(df):
+        """
+        Content hash of a DataFrame, eg of the processed events.
+        """
+        row_hashes = pd.util.hash_pandas_object(df, index=True).to_numpy()
+        columns = json.dumps([str(column) for column in df.columns])
+        return hashlib.sha256(row_hashes.tobytes() + columns.encode()).hexdigest()
+
+    def is_fresh(self, stage, key):
+        """
+        Checks if the stage already ran with the same key and all its outputs still exist.
+        """
+        entry = self.stages.get(stage)
+        if entry is None or entry["key"] != key:
+            return False
+        return all(os.path.exists(path) for path in entry["outputs"])
+
+    def get_outputs(self, stage):
+        return self.stages[stage]["outputs"]
+
+    def update(self, stage, key, outputs):
+        """
+        Records the key and the output files of a stage that just ran and saves the cache.
+        """
+        self.stages[stage] = {"key": key, "outputs": list(outputs)}
+        self.save()
+
+    def invalidate(self, stage):
+        if self.stages.pop(stage, None) is not None:
+            self.save()
+
+    def save(self):
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(self.path, "w") as file:
+            json.dump(self.stages, file, indent=1)
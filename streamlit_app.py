@@ -8,6 +8,7 @@ from zipfile import ZipFile
 from PIL import Image
 from concurrent.futures import ThreadPoolExecutor
 from probability_matrix import GetMatrix,ProbabilityMatrix
+from manifest import FileManifest
 
 
 st.cache_data.clear()
@@ -125,45 +126,50 @@ return_types=[]
 
 sessions=[]
 latest_custom_days_urls=[]
-for file in os.scandir(plots_directory):
-    if file.is_file():
-        if file.name.endswith('.png'):
-            plotfile_content=file.name.split('_')
-            plot_url=plot_url_base+file.name
-            instrument=plotfile_content[0]
-            interval=plotfile_content[1]
-            return_type=plotfile_content[2]
-
-            intervals.append(interval)
-            instruments.append(instrument)
-            plot_urls.append({
-                "url": plot_url,
-                "instrument": instrument,
-                "interval": interval,
-                "return_type": return_type,
-                "stats_url": 
-                (plot_url_base+f'{instrument}_{interval}_{return_type}_stats.csv').replace('Volatility', 'Volatility_Returns')
-            })
-        elif file.name.endswith('.csv') and 'latest_custom_days' in file.name:
-            if 'stats' not in str(file.name):
-                latest_custom_days_content=file.name.split('_')
-                latest_custom_days_url=plot_url_base+file.name
-                joined_session="_".join((latest_custom_days_content[0:-7:1]))
-                spaced_session=" ".join(joined_session.split('_'))
-                instrument=(latest_custom_days_content[-1])
-                instrument=instrument.replace('.csv','')
-                interval=latest_custom_days_content[-2]
-                return_type=latest_custom_days_content[-4]
-
-                sessions.append(spaced_session)
-                latest_custom_days_urls.append({
-                "url": latest_custom_days_url,
-                'stats_url':plot_url_base+(file.name).split('.')[0]+'_stats.csv',
-                "instrument": instrument,
-                "interval": interval,
-                "return_type": return_type,
-                "session": [joined_session,spaced_session]
-            })
+# Files are listed from the manifest of the plots folder instead of scanning it and splitting the file names
+plots_manifest=FileManifest(plots_directory,read_only=True) # Read again on every rerun, the outputs change between runs
+for plot_record in plots_manifest.find(kind='plot',profile=''):
+    plot_url=plot_url_base+plot_record['name']
+
+    # Full resolution image is only rendered on request into the "print" subfolder
+    print_name='print/'+os.path.splitext(plot_record['name'])[0]+'.png'
+    if print_name in plots_manifest.records:
+        download_url=plot_url_base+print_name
+    else:
+        download_url=plot_url
+    instrument=plot_record['ticker']
+    interval=plot_record['interval']
+    return_type=plot_record['return_type']
+
+    intervals.append(interval)
+    instruments.append(instrument)
+    plot_urls.append({
+        "url": plot_url,
+        "download_url": download_url,
+        "instrument": instrument,
+        "interval": interval,
+        "return_type": return_type,
+        "stats_url": 
+        (plot_url_base+f'{instrument}_{interval}_{return_type}_stats.csv').replace('Volatility', 'Volatility_Returns')
+    })
+
+for latest_custom_days_record in plots_manifest.find(kind='latest_custom_days'):
+    latest_custom_days_url=plot_url_base+latest_custom_days_record['name']
+    joined_session=latest_custom_days_record['session']
+    spaced_session=" ".join(joined_session.split('_'))
+    instrument=latest_custom_days_record['ticker']
+    interval=latest_custom_days_record['interval']
+    return_type=latest_custom_days_record['return_type']
+
+    sessions.append(spaced_session)
+    latest_custom_days_urls.append({
+        "url": latest_custom_days_url,
+        'stats_url':plot_url_base+(latest_custom_days_record['name']).split('.')[0]+'_stats.csv',
+        "instrument": instrument,
+        "interval": interval,
+        "return_type": return_type,
+        "session": [joined_session,spaced_session]
+    })
             
 # Storing unique lists to be used later in separate drop-downs
 unique_intervals=list(set(intervals)) #Interval drop-down (1hr,15min,etc)
@@ -278,8 +284,8 @@ with tab1:
                 all_dataframes.append(pd.read_csv(plot['stats_url']))
                 tab1_sheet_names.append(caption+' Stats')
 
-                # Save images into a list
-                image_url_list.append(plot['url'])
+                # Save images into a list (full resolution if available)
+                image_url_list.append(plot['download_url'])
                 tab1_image_names.append(f'{y}_{x}_{caption}')
 
             # Download Stats dataframes as Excel
@@ -0,0 +1,33 @@
+import pytest
+import kernels
+
+
+def test_numba_and_pandas_kernels_are_equivalent():
+    pytest.importorskip("numba")
+    assert kernels.check_kernel_equivalence(n_bars=20000) is True
+
+
+def test_python_kernels_and_pandas_are_equivalent():
+    # Runs the kernel bodies as plain Python, so it also covers them without numba
+    assert kernels.check_kernel_equivalence(n_bars=5000, compiled=False) is True
+
+
+def test_python_kernels_are_restored():
+    compiled_kernels = (kernels._aggregate_groups, kernels._mark_time_windows)
+    kernels.check_kernel_equivalence(n_bars=1000, compiled=False)
+    assert (kernels._aggregate_groups, kernels._mark_time_windows) == compiled_kernels
+
+
+def test_equivalence_not_checked_without_numba(monkeypatch):
+    monkeypatch.setattr(kernels, "NUMBA_AVAILABLE", False)
+    assert kernels.check_kernel_equivalence(n_bars=1000) is None
+
+
+def test_numba_backend_falls_back_to_pandas_without_numba(monkeypatch):
+    monkeypatch.setattr(kernels, "NUMBA_AVAILABLE", False)
+    assert kernels.get_kernel_backend("numba") == "pandas"
+
+
+def test_invalid_kernel_backend():
+    with pytest.raises(ValueError):
+        kernels.get_kernel_backend("cython")